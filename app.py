@@ -5,8 +5,14 @@ import time
 import sys
 import argparse
 import json
+import mmap
+import queue
+import re
 import subprocess
+from functools import lru_cache
+from collections import OrderedDict
 from typing import List, Dict, Tuple, Optional, Set
+import numpy as np
 from PIL import Image
 
 # 尝试导入 TensorFlow
@@ -15,6 +21,27 @@ try:
 except ImportError:
     pass
 
+# (新) 尝试导入 Numba (可选，用于 JIT 编译搜索过滤内核)
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# (新) 尝试导入 pyahocorasick (可选，用于多词英文模糊匹配)
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# (新) 尝试导入 orjson (可选，用于更快地读写配置文件)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # 导入后端核心模块
 # (我们将有条件地导入，以支持 --search-only)
 from database_manager import DatabaseManager
@@ -23,6 +50,13 @@ from dictionary_manager import DictionaryManager
 # --- 全局配置 ---
 CONFIG_FILE = "illutag_config.json"
 LOADED_CONFIG = {"allowed_paths": []}
+INDEX_CACHE_DIR = "illutag_index_cache" # (新) 搜索索引的磁盘缓存目录
+
+# (新) 已管理文件夹的规范化键 (normcase + normpath) -> allowed_paths 中的原始条目
+# allowed_paths 列表保持顺序并写入 JSON；_PATH_MAP 只用于 O(1) 的成员判断
+_PATH_MAP: Dict[str, str] = {}
+_CWD = os.path.normpath(os.getcwd())
+_CWD_NORM = os.path.normcase(_CWD)
 
 # --- 启动模式 ---
 # 1. 创建 ArgumentParser
@@ -59,15 +93,164 @@ else:
         print("请检查 TensorFlow/Keras/模型文件是否完好。")
         sys.exit(1)
 
+# --- (新) 内存搜索索引 ---
+# 数据库仍然是唯一的数据源；这里只是一份只读缓存，
+# 在启动时以及每次扫描完成后从数据库重新构建。
+_TAG_INDEX: Dict[str, Set[int]] = {} # 倒排索引: tag_name -> {image_id}
+_IMG_BY_ID: Dict[int, Dict] = {}     # image_id -> item (不含标签列表，标签见下面的结构化数组)
+# (新) 结构化数组 (SoA)：所有图片的标签拼接成两个平行的大数组，
+# 第 r 行图片的标签位于 [_OFFSETS[r], _OFFSETS[r+1])，顺序与数据库中的顺序一致
+_TAG_TO_ID: Dict[str, int] = {}      # tag_name -> 整数标签 ID
+_ROW_OF_ID: Dict[int, int] = {}      # image_id -> 行号 (按 image_id 升序分配)
+_ROW_ITEMS: List[Dict] = []          # 行号 -> item
+_FAVORITES_BITMAP = np.zeros(0, dtype=np.uint8) # (新) 按行号打包的收藏位图 (little 位序)
+_ALL_TAG_IDS = np.empty(0, dtype=np.int32)
+_ALL_SCORES = np.empty(0, dtype=np.float32)
+_OFFSETS = np.zeros(1, dtype=np.int64)
+_INDEX_LOCK = threading.Lock()       # 保护上面各个引用的整体替换
+_TAGS_VERSION = 0                    # (新) 每次重建索引 (即扫描完成) 时递增，用于使缓存失效
+_ALL_TAG_NAMES: Tuple[str, ...] = () # (新) 标签词表 (按 ID 顺序，字符串已 intern)，标签 ID -> 标签名的唯一来源
+_TRIGRAM_INDEX: Dict[str, Set[int]] = {} # (新) 词表的三字母组索引: trigram -> {标签 ID}
+
+# (新) 英文输入的分词：逗号视为空格，再按空白切分
+_COMMA_TO_SPACE = str.maketrans(",", " ")
+_TOKEN_SPLIT = re.compile(r"\s+")
+
+
+def _filter_rows_numpy(all_tag_ids, all_scores, offsets, rows, lo, hi, query_ids_sorted, match_any):
+    """
+    (新) 过滤内核的 NumPy 版本 (未安装 Numba 时使用)。
+    返回布尔数组：rows 中的每一行是否至少有一个分数在 [lo, hi] 内
+    (且 match_any 为 False 时，标签 ID 在 query_ids_sorted 中) 的标签。
+    """
+    tag_mask = (all_scores >= lo) & (all_scores <= hi)
+    if not match_any:
+        tag_mask &= np.isin(all_tag_ids, query_ids_sorted)
+    # 用前缀和统计每一行命中的标签数
+    cumsum = np.concatenate((np.zeros(1, dtype=np.int64), np.cumsum(tag_mask, dtype=np.int64)))
+    return (cumsum[offsets[rows + 1]] - cumsum[offsets[rows]]) > 0
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _filter_rows_numba(all_tag_ids, all_scores, offsets, rows, lo, hi, query_ids_sorted, match_any):
+        """
+        (新) 过滤内核的 Numba 版本，语义与 _filter_rows_numpy 相同。
+        不使用 parallel=True：Gradio 会在多个工作线程中并发调用本函数，
+        而 Numba 的 workqueue 线程层 (无 TBB/OpenMP 时的默认值) 不支持并发进入，会直接中止进程。
+        """
+        n = rows.shape[0]
+        n_query = query_ids_sorted.shape[0]
+        hits = np.zeros(n, dtype=np.bool_)
+        for k in range(n):
+            row = rows[k]
+            for j in range(offsets[row], offsets[row + 1]):
+                score = all_scores[j]
+                if score < lo or score > hi:
+                    continue
+                if match_any:
+                    hits[k] = True
+                    break
+                # 二分查找判断标签是否在查询集合中
+                pos = np.searchsorted(query_ids_sorted, all_tag_ids[j])
+                if pos < n_query and query_ids_sorted[pos] == all_tag_ids[j]:
+                    hits[k] = True
+                    break
+        return hits
+
+    _filter_rows = _filter_rows_numba
+else:
+    _filter_rows = _filter_rows_numpy
+
+def _build_trigram_index(tag_names: Tuple[str, ...]) -> Dict[str, Set[int]]:
+    """(新) 为标签词表构建三字母组倒排索引: trigram -> {标签 ID}。"""
+    trigram_index: Dict[str, Set[int]] = {}
+    for tag_id, tag_name in enumerate(tag_names):
+        for i in range(len(tag_name) - 2):
+            trigram_index.setdefault(tag_name[i:i + 3], set()).add(tag_id)
+    return trigram_index
+
+def _scan_en_fuzzy_tags(en_fuzzy_terms: List[str], tag_names: Tuple[str, ...]) -> Set[int]:
+    """
+    (新) 线性扫描词表，返回包含任一模糊词的标签 ID。
+    安装了 pyahocorasick 且有多个词时，用 Aho-Corasick 自动机对每个标签名只扫描一遍。
+    """
+    if not AHOCORASICK_AVAILABLE or len(en_fuzzy_terms) == 1:
+        return {
+            tag_id for tag_id, tag_name in enumerate(tag_names)
+            if any(term in tag_name for term in en_fuzzy_terms)
+        }
+
+    automaton = ahocorasick.Automaton()
+    for term in en_fuzzy_terms:
+        automaton.add_word(term, term)
+    automaton.make_automaton()
+    return {tag_id for tag_id, tag_name in enumerate(tag_names) if next(automaton.iter(tag_name), None) is not None}
+
+def _match_en_fuzzy_tags(en_fuzzy_terms: List[str], tag_names: Tuple[str, ...], trigram_index: Dict[str, Set[int]]) -> Set[str]:
+    """
+    (新) 返回 tag_names 中包含任一英文模糊词的标签名。
+    长度 >= 3 的词先用三字母组索引求交集得到候选，再用真实的子串检查确认；
+    更短的词没有三字母组可用，退回线性扫描。
+    """
+    matched_ids: Set[int] = set()
+    short_terms: List[str] = []
+
+    for term in en_fuzzy_terms:
+        if len(term) < 3:
+            short_terms.append(term)
+            continue
+        postings = [trigram_index.get(term[i:i + 3]) for i in range(len(term) - 2)]
+        if any(p is None for p in postings):
+            continue # 某个三字母组从未出现，不可能匹配
+        postings.sort(key=len) # 从最小的集合开始求交集
+        candidates = postings[0].intersection(*postings[1:])
+        matched_ids.update(tag_id for tag_id in candidates if term in tag_names[tag_id])
+
+    if short_terms:
+        matched_ids |= _scan_en_fuzzy_tags(short_terms, tag_names)
+
+    return {tag_names[tag_id] for tag_id in matched_ids}
+
+def _readonly_view(array: np.ndarray) -> np.ndarray:
+    """
+    (新) 返回数组的只读 ndarray 视图 (np.asarray 去掉 np.memmap 子类)。
+    Numba 按 "是否可写" 区分数组类型：标签数组无论来自 mmap 缓存还是数据库，都统一为只读视图，
+    过滤内核只需编译一个特化版本。
+    """
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
+
+def warm_up_filter_kernel():
+    """(新) 用空数据调用一次过滤内核，让 Numba 在启动时完成编译，避免首次搜索卡顿。"""
+    if not NUMBA_AVAILABLE:
+        return
+    # 参数类型必须与真实搜索一致：三个标签数组为只读视图 (见 _readonly_view)，其余为普通数组
+    _filter_rows(
+        _readonly_view(np.zeros(1, dtype=np.int32)),
+        _readonly_view(np.zeros(1, dtype=np.float32)),
+        _readonly_view(np.array([0, 1], dtype=np.int64)),
+        np.zeros(1, dtype=np.int64), np.float32(0.0), np.float32(1.0), np.zeros(1, dtype=np.int32), False
+    )
+
 # --- 辅助函数 ---
 
+def _canonical_path(path: str) -> str:
+    """(新) 路径的规范化键，用于比较 (Windows 下不区分大小写)。"""
+    return os.path.normcase(os.path.normpath(path))
+
 def load_config():
     """在启动时加载配置文件"""
     global LOADED_CONFIG
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
+            with open(CONFIG_FILE, 'rb') as f:
+                if ORJSON_AVAILABLE:
+                    # (新) 以 mmap 方式直接交给 orjson 解析，避免额外的读取拷贝
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                        config_data = orjson.loads(view)
+                else:
+                    config_data = json.loads(f.read().decode('utf-8'))
                 # (新) 健壮性检查：确保加载的是字典
                 if isinstance(config_data, dict):
                     LOADED_CONFIG = config_data
@@ -91,10 +274,24 @@ def load_config():
         # 如果文件不存在，创建一个空的
         save_config()
     
+    # (新) 构建规范化路径映射，同时去掉只有大小写或分隔符不同的重复路径 (保留第一个)，
+    # 保证 allowed_paths 与 _PATH_MAP 一一对应，下拉框中的每一项都可以被移除
+    _PATH_MAP.clear()
+    unique_paths = []
+    for path in LOADED_CONFIG['allowed_paths']:
+        canonical_path = _canonical_path(path)
+        if canonical_path not in _PATH_MAP:
+            _PATH_MAP[canonical_path] = path
+            unique_paths.append(path)
+    if len(unique_paths) != len(LOADED_CONFIG['allowed_paths']):
+        print(f"警告：配置中有 {len(LOADED_CONFIG['allowed_paths']) - len(unique_paths)} 个重复路径，已合并。")
+        LOADED_CONFIG['allowed_paths'] = unique_paths
+        save_config()
+
     # 确保至少包含当前工作目录
-    cwd = os.path.normpath(os.getcwd())
-    if cwd not in LOADED_CONFIG['allowed_paths']:
-        LOADED_CONFIG['allowed_paths'].append(cwd)
+    if _CWD_NORM not in _PATH_MAP:
+        LOADED_CONFIG['allowed_paths'].append(_CWD)
+        _PATH_MAP[_CWD_NORM] = _CWD
     
     print(f"Gradio 已获准访问以下路径: {LOADED_CONFIG['allowed_paths']}")
     return LOADED_CONFIG
@@ -102,11 +299,185 @@ def load_config():
 def save_config():
     """保存配置到 JSON 文件"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(LOADED_CONFIG, f, indent=4, ensure_ascii=False)
+        if ORJSON_AVAILABLE:
+            with open(CONFIG_FILE, 'wb') as f:
+                f.write(orjson.dumps(LOADED_CONFIG, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+                json.dump(LOADED_CONFIG, f, indent=4, ensure_ascii=False)
     except Exception as e:
         print(f"错误：保存配置 {CONFIG_FILE} 失败: {e}")
 
+# (新) 搜索索引磁盘缓存中的数组文件 (每个数组一个 .npy，启动时以 mmap 方式按需读取)
+# 文件名带有代号 (<数组名>.<代号>.npy)，当前代号记录在 meta.json 中
+_INDEX_CACHE_ARRAYS = ('image_ids', 'favorites_bitmap', 'tag_ids', 'scores', 'offsets')
+
+def _load_index_cache(data_version: int) -> Optional[Tuple[Dict[str, np.ndarray], List[str], List[str]]]:
+    """
+    (新) 如果磁盘缓存与数据库一致，则以 mmap 方式加载它。返回 (数组, 文件路径列表, 标签词表)。
+    一致性由数据库中持久化的数据版本号判断 (而非文件的修改时间：关闭连接时的 WAL 检查点会改写数据库文件)。
+    """
+    meta_path = os.path.join(INDEX_CACHE_DIR, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        generation = meta.get('generation')
+        if meta.get('data_version') != data_version or not generation:
+            return None
+        arrays = {
+            name: np.load(os.path.join(INDEX_CACHE_DIR, f"{name}.{generation}.npy"), mmap_mode='r')
+            for name in _INDEX_CACHE_ARRAYS
+        }
+        return arrays, meta['file_paths'], meta['vocab']
+    except Exception as e:
+        print(f"警告：读取搜索索引缓存失败，将从数据库重建: {e}")
+        return None
+
+def _save_index_cache(data_version: int, arrays: Dict[str, np.ndarray], file_paths: List[str], vocab: List[str]):
+    """
+    (新) 将搜索索引的结构化数组写入磁盘缓存。
+    每次保存都写入新代号的文件，不覆盖本进程可能仍以 mmap 打开的旧文件 (Windows 下无法截断已映射的文件)；
+    数组写完后才通过 os.replace 原子地切换 meta.json，写到一半时旧缓存仍然完整可用。
+    """
+    meta_path = os.path.join(INDEX_CACHE_DIR, "meta.json")
+    generation = f"{time.time_ns():x}"
+    try:
+        os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+        for name in _INDEX_CACHE_ARRAYS:
+            np.save(os.path.join(INDEX_CACHE_DIR, f"{name}.{generation}.npy"), arrays[name])
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'generation': generation, 'data_version': data_version, 'file_paths': file_paths, 'vocab': vocab}, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+    except Exception as e:
+        print(f"警告：保存搜索索引缓存失败: {e}")
+        return
+    _remove_stale_index_files(generation)
+
+def _remove_stale_index_files(keep_generation: str):
+    """
+    (新) 删除其他代号 (以及旧版无代号) 的数组文件。
+    仍被 mmap 打开的文件在 Windows 下无法删除，忽略错误，留到下一次保存时再清理。
+    """
+    keep_suffix = f".{keep_generation}.npy"
+    for file_name in os.listdir(INDEX_CACHE_DIR):
+        if file_name.endswith(".npy") and not file_name.endswith(keep_suffix):
+            try:
+                os.remove(os.path.join(INDEX_CACHE_DIR, file_name))
+            except OSError:
+                pass
+
+def _read_index_arrays_from_db() -> Tuple[Dict[str, np.ndarray], List[str], List[str]]:
+    """(新) 从数据库读取所有图片，打包为结构化数组。返回 (数组, 文件路径列表, 标签词表)。"""
+    image_ids: List[int] = []
+    favorites: List[bool] = []
+    file_paths: List[str] = []
+    tag_to_id: Dict[str, int] = {}
+    tag_ids: List[int] = []
+    scores: List[float] = []
+    offsets: List[int] = [0]
+
+    for item in DB_MANAGER.get_all_indexed_images():
+        image_ids.append(item['image_id'])
+        favorites.append(item['is_favorite'])
+        file_paths.append(item['file_path'])
+        for tag_info in item['tags']:
+            tag_ids.append(tag_to_id.setdefault(sys.intern(tag_info['tag_name']), len(tag_to_id)))
+            scores.append(tag_info['score'])
+        offsets.append(len(tag_ids))
+
+    arrays = {
+        'image_ids': np.asarray(image_ids, dtype=np.int64),
+        'favorites_bitmap': np.packbits(np.asarray(favorites, dtype=np.bool_), bitorder='little'),
+        'tag_ids': np.asarray(tag_ids, dtype=np.int32),
+        'scores': np.asarray(scores, dtype=np.float32),
+        'offsets': np.asarray(offsets, dtype=np.int64),
+    }
+    return arrays, file_paths, list(tag_to_id)
+
+def rebuild_search_index():
+    """
+    (新) 重新构建内存中的倒排标签索引。
+    优先使用与数据库一致的磁盘缓存；缓存过期时从数据库读取并刷新缓存。
+    """
+    global _TAG_INDEX, _IMG_BY_ID, _TAG_TO_ID, _ROW_OF_ID, _ROW_ITEMS, _FAVORITES_BITMAP
+    global _ALL_TAG_IDS, _ALL_SCORES, _OFFSETS
+    global _TAGS_VERSION, _ALL_TAG_NAMES, _TRIGRAM_INDEX
+
+    # 先取版本号再读数据库：读取期间如有写入，下次启动时缓存会被判定为过期
+    data_version = DB_MANAGER.get_data_version()
+    cached = _load_index_cache(data_version) if data_version is not None else None
+    if cached is not None:
+        arrays, file_paths, vocab = cached
+        source = "磁盘缓存"
+    else:
+        arrays, file_paths, vocab = _read_index_arrays_from_db()
+        if data_version is not None:
+            _save_index_cache(data_version, arrays, file_paths, vocab)
+        source = "数据库"
+
+    all_tag_ids, all_scores, offsets = (_readonly_view(arrays[name]) for name in ('tag_ids', 'scores', 'offsets'))
+    # 每个标签名在内存中只保留一份 (intern 后字典查找可直接比较身份)
+    all_tag_names = tuple(sys.intern(tag_name) for tag_name in vocab)
+    tag_to_id = {tag_name: i for i, tag_name in enumerate(all_tag_names)}
+    tag_index: Dict[str, Set[int]] = {}
+    img_by_id: Dict[int, Dict] = {}
+    row_of_id: Dict[int, int] = {}
+    row_items: List[Dict] = []
+
+    # 位图需要在切换收藏时原地修改，不能直接使用只读的 mmap 数组
+    image_ids = arrays['image_ids'].tolist()
+    favorites_bitmap = np.array(arrays['favorites_bitmap'], dtype=np.uint8)
+    favorite_flags = np.unpackbits(favorites_bitmap, count=len(image_ids), bitorder='little').tolist()
+
+    tag_ids_list = np.asarray(all_tag_ids).tolist()
+    offsets_list = np.asarray(offsets).tolist()
+
+    # item 中不再保存标签列表 (每张图片几十个小字典)，选中图片时由 _get_item_tags 从数组中生成
+    for row, (image_id, is_favorite, file_path) in enumerate(zip(image_ids, favorite_flags, file_paths)):
+        for tag_id in tag_ids_list[offsets_list[row]:offsets_list[row + 1]]:
+            tag_index.setdefault(all_tag_names[tag_id], set()).add(image_id)
+
+        basename = os.path.basename(file_path)
+        img_by_id[image_id] = item = {
+            "image_id": image_id,
+            "file_path": file_path,
+            "is_favorite": bool(is_favorite),
+            # 预先计算文件名，避免每次搜索都重复 basename + lower
+            "_basename": basename,
+            "_basename_lower": basename.lower(),
+        }
+        row_of_id[image_id] = row
+        row_items.append(item)
+
+    trigram_index = _build_trigram_index(all_tag_names)
+
+    # 一次性替换全部引用，搜索线程不会看到构建到一半的索引
+    with _INDEX_LOCK:
+        _TAG_INDEX, _IMG_BY_ID = tag_index, img_by_id
+        _TAG_TO_ID, _ROW_OF_ID, _ROW_ITEMS, _FAVORITES_BITMAP = tag_to_id, row_of_id, row_items, favorites_bitmap
+        _ALL_TAG_IDS, _ALL_SCORES, _OFFSETS = all_tag_ids, all_scores, offsets
+        _ALL_TAG_NAMES, _TRIGRAM_INDEX = all_tag_names, trigram_index
+        _TAGS_VERSION += 1
+    # (新) 旧版本号的完整图库缓存不会再被命中，清空它以释放上一份索引的数组 (包括 mmap)
+    _full_gallery.cache_clear()
+
+    print(f"搜索索引已重建 (来源: {source}): {len(img_by_id)} 张图片, {len(tag_index)} 个唯一标签。")
+
+def _get_item_tags(image_id: int) -> List[Tuple[str, float]]:
+    """(新) 从结构化数组中读取一张图片的 (标签名, 分数) 列表，顺序与数据库一致。"""
+    with _INDEX_LOCK:
+        row = _ROW_OF_ID.get(image_id)
+        if row is None:
+            return []
+        all_tag_names, all_tag_ids, all_scores, offsets = _ALL_TAG_NAMES, _ALL_TAG_IDS, _ALL_SCORES, _OFFSETS
+    start, end = int(offsets[row]), int(offsets[row + 1])
+    # 分数在数组中为 float32；入库时已保留 4 位小数，这里还原为原始值用于显示
+    scores = np.round(np.asarray(all_scores[start:end], dtype=np.float64), 4).tolist()
+    return [(all_tag_names[tag_id], score) for tag_id, score in zip(all_tag_ids[start:end].tolist(), scores)]
+
 def add_folder_to_config(folder_path: str):
     """(新) 添加文件夹到配置并保存"""
     global LOADED_CONFIG
@@ -116,8 +487,10 @@ def add_folder_to_config(folder_path: str):
         # (新) 修复：返回 3 个值以匹配 outputs
         return f"错误: 路径 '{normalized_path}' 无效或不存在。", "\n".join(LOADED_CONFIG['allowed_paths']), gr.Dropdown(choices=LOADED_CONFIG['allowed_paths'])
 
-    if normalized_path not in LOADED_CONFIG['allowed_paths']:
+    canonical_path = os.path.normcase(normalized_path)
+    if canonical_path not in _PATH_MAP:
         LOADED_CONFIG['allowed_paths'].append(normalized_path)
+        _PATH_MAP[canonical_path] = normalized_path
         save_config()
         
         folders_list = "\n".join(LOADED_CONFIG['allowed_paths'])
@@ -139,13 +512,13 @@ def remove_folder_from_config(folder_to_remove: str):
         return "错误：未选择文件夹。", "\n".join(LOADED_CONFIG['allowed_paths']), gr.Dropdown(choices=LOADED_CONFIG['allowed_paths'], value=None)
 
     # (新) 安全检查：不允许移除当前工作目录
-    cwd = os.path.normpath(os.getcwd())
-    if os.path.normpath(folder_to_remove) == cwd:
-        msg = f"错误：不能移除当前工作目录 ({cwd})。"
+    canonical_path = _canonical_path(folder_to_remove)
+    if canonical_path == _CWD_NORM:
+        msg = f"错误：不能移除当前工作目录 ({_CWD})。"
         return msg, "\n".join(LOADED_CONFIG['allowed_paths']), gr.Dropdown(choices=LOADED_CONFIG['allowed_paths'], value=None)
 
-    if folder_to_remove in LOADED_CONFIG['allowed_paths']:
-        LOADED_CONFIG['allowed_paths'].remove(folder_to_remove)
+    if canonical_path in _PATH_MAP:
+        LOADED_CONFIG['allowed_paths'].remove(_PATH_MAP.pop(canonical_path))
         save_config()
         msg = f"成功移除: {folder_to_remove}\n\n请注意：您必须重启本应用 (app.py) 才能使此更改完全生效。"
         # (新) 更新 choices
@@ -156,28 +529,65 @@ def remove_folder_from_config(folder_to_remove: str):
         return msg, "\n".join(LOADED_CONFIG['allowed_paths']), gr.Dropdown(choices=LOADED_CONFIG['allowed_paths'], value=None)
 
 
-def start_rescan_all_folders_thread():
-    """(新) 在新线程中启动对所有管理文件夹的扫描"""
-    global LOADED_CONFIG
-    if SCAN_ENGINE.get_status().get("is_scanning"):
-        return "扫描正在进行中..."
+# (新) 扫描任务队列：每个任务是一组要扫描的文件夹，由唯一的后台扫描线程依次处理
+_SCAN_QUEUE: "queue.Queue[List[str]]" = queue.Queue()
+# (新) 已入队但尚未完成的任务数 (排队中 + 正在执行，包括扫描后的索引重建)。
+# 入队时加一、任务结束时减一，都在 _SCAN_JOBS_LOCK 下进行：
+# 从 get() 取出任务到 scan_folders 设置 is_scanning 之间，任务仍被计为进行中
+_SCAN_JOBS_LOCK = threading.Lock()
+_SCAN_PENDING_JOBS = 0
 
-    folders_to_scan = LOADED_CONFIG.get('allowed_paths', [])
-    if not folders_to_scan:
-        return "错误：没有已管理的文件夹可供扫描。"
-        
-    def scan_all():
-        print(f"开始重新扫描所有 {len(folders_to_scan)} 个文件夹...")
-        for folder in folders_to_scan:
-            if os.path.isdir(folder):
-                print(f"--- 正在扫描: {folder} ---")
-                # start_scan 是一个阻塞操作，它会完成一个文件夹再到下一个
-                SCAN_ENGINE.start_scan(folder, None, force_rescan=False)
-            else:
-                print(f"跳过无效路径: {folder}")
-        print("所有文件夹扫描完成。")
-
-    threading.Thread(target=scan_all, daemon=True).start()
+def _scan_worker():
+    """(新) 常驻的后台扫描线程 (完整模式启动时创建一次)。"""
+    global _SCAN_PENDING_JOBS
+    while True:
+        folders_to_scan = _SCAN_QUEUE.get()
+        try:
+            print(f"开始重新扫描所有 {len(folders_to_scan)} 个文件夹...")
+            valid_folders = []
+            for folder in folders_to_scan:
+                if os.path.isdir(folder):
+                    valid_folders.append(folder)
+                else:
+                    print(f"跳过无效路径: {folder}")
+            # (新) scan_folders 并行遍历所有文件夹，并让图片解码与模型推理重叠进行
+            # 取消标志在任务入队时已清除；这里不再清除，避免丢失排队期间发出的取消请求
+            SCAN_ENGINE.scan_folders(valid_folders, None, force_rescan=False, reset_cancel=False)
+            print("所有文件夹扫描完成。")
+            # 扫描被取消时也重建索引，让已处理的图片可以被搜索到
+            rebuild_search_index()
+        except Exception as e:
+            print(f"后台扫描任务失败: {e}")
+        finally:
+            with _SCAN_JOBS_LOCK:
+                _SCAN_PENDING_JOBS -= 1
+
+def start_rescan_all_folders_thread():
+    """
+    (新) 将对所有管理文件夹的扫描加入后台扫描队列，立即返回。
+    扫描进行中 (或已有任务在排队) 时再次点击：清空队列并停止当前扫描。
+    """
+    global LOADED_CONFIG, _SCAN_PENDING_JOBS
+    with _SCAN_JOBS_LOCK:
+        if _SCAN_PENDING_JOBS > 0:
+            while True:
+                try:
+                    _SCAN_QUEUE.get_nowait()
+                except queue.Empty:
+                    break
+                _SCAN_PENDING_JOBS -= 1
+            # 已被后台线程取出的任务 (无论是否已开始扫描) 都会看到这个取消请求
+            SCAN_ENGINE.request_cancel()
+            return "已请求停止扫描，已处理的图片会保留。"
+
+        folders_to_scan = LOADED_CONFIG.get('allowed_paths', [])
+        if not folders_to_scan:
+            return "错误：没有已管理的文件夹可供扫描。"
+
+        # 此时没有任务在排队或执行，清除上一次的取消请求是安全的
+        SCAN_ENGINE.reset_cancel()
+        _SCAN_PENDING_JOBS += 1
+        _SCAN_QUEUE.put(list(folders_to_scan))
     return f"开始重新扫描所有 {len(folders_to_scan)} 个已添加的文件夹..."
 
 def check_scan_status():
@@ -205,14 +615,29 @@ def check_scan_status():
         return progress, status_text
     else:
         # 初始状态或空任务完成
-        initial_processed = DB_MANAGER.get_all_indexed_file_paths()
-        initial_count = len(initial_processed)
+        initial_count = DB_MANAGER.get_indexed_count()
         if initial_count > 0:
              status_text = f"等待启动扫描... (数据库中已索引 {initial_count} 个文件)"
         else:
              status_text = "等待启动扫描..."
         return 0.0, status_text
 
+@lru_cache(maxsize=1024)
+def _suggest(prefix: str, version: int) -> Optional[Tuple[str, ...]]:
+    """
+    (新) 中文联想的缓存实现。
+    version 只作为缓存键的一部分 (传入 _TAGS_VERSION)，扫描完成后旧的缓存自然失效。
+    数据库中没有任何标签时返回 None。
+    """
+    # 1. 获取数据库中已存在的所有英文标签 (DatabaseManager 按数据版本号缓存该集合)
+    allowed_en_tags = DB_MANAGER.get_all_indexed_tags()
+    
+    if not allowed_en_tags:
+        return None
+
+    # 2. 模糊查找所有包含该词的精确中文标签，并根据数据库标签集进行过滤
+    return tuple(DICTIONARY_MANAGER.fuzzy_lookup_suggestions(prefix, allowed_en_tags=allowed_en_tags))
+
 def get_cn_suggestions(cn_partial_input: str) -> Tuple[gr.Dropdown, str]:
     """
     根据中文模糊输入，获取联想到的中文标签列表，并更新下拉框。
@@ -222,21 +647,14 @@ def get_cn_suggestions(cn_partial_input: str) -> Tuple[gr.Dropdown, str]:
     if not cn_partial_input:
         return gr.Dropdown(choices=[], value=None, visible=False), ""
 
-    # 1. 获取数据库中已存在的所有英文标签 
-    allowed_en_tags = DB_MANAGER.get_all_indexed_tags()
+    suggestions = _suggest(cn_partial_input, _TAGS_VERSION)
     
-    if not allowed_en_tags:
+    if suggestions is None:
         msg = "数据库中没有索引标签。请先进行扫描。"
         return gr.Dropdown(choices=[], value=None, visible=False), msg
 
-    # 2. 模糊查找所有包含该词的精确中文标签，并根据数据库标签集进行过滤
-    suggestions = DICTIONARY_MANAGER.fuzzy_lookup_suggestions(
-        cn_partial_input, 
-        allowed_en_tags=allowed_en_tags
-    )
-
     if suggestions:
-        options = suggestions
+        options = list(suggestions)
         msg = f"已找到 {len(suggestions)} 个包含 '{cn_partial_input}' 的联想词 (已过滤)。"
         return gr.Dropdown(choices=options, value=None, visible=True), msg
     else:
@@ -244,6 +662,66 @@ def get_cn_suggestions(cn_partial_input: str) -> Tuple[gr.Dropdown, str]:
         return gr.Dropdown(choices=[], value=None, visible=False), msg
 
 
+# (新) 联想输入的防抖：每个会话记录最近一次请求的序号，过期的请求直接丢弃
+# 会话关闭时不会通知服务器，因此只保留最近活跃的 _SUGGEST_SEQ_MAX_SESSIONS 个会话 (按 LRU 淘汰)
+_SUGGEST_DEBOUNCE_SECONDS = 0.08
+_SUGGEST_SEQ_MAX_SESSIONS = 1024
+_SUGGEST_SEQ: "OrderedDict[str, int]" = OrderedDict()
+_SUGGEST_SEQ_LOCK = threading.Lock()
+
+def get_cn_suggestions_debounced(cn_partial_input: str, request: gr.Request) -> Tuple[gr.Dropdown, str]:
+    """
+    (新) 带防抖的 get_cn_suggestions，用于 cn_partial_input.change。
+    快速连续输入时，只有最后一次按键会真正执行联想，之前的请求不更新界面。
+    """
+    session_key = request.session_hash if request is not None else ""
+    with _SUGGEST_SEQ_LOCK:
+        seq = _SUGGEST_SEQ.get(session_key, 0) + 1
+        _SUGGEST_SEQ[session_key] = seq
+        _SUGGEST_SEQ.move_to_end(session_key)
+        if len(_SUGGEST_SEQ) > _SUGGEST_SEQ_MAX_SESSIONS:
+            _SUGGEST_SEQ.popitem(last=False)
+
+    time.sleep(_SUGGEST_DEBOUNCE_SECONDS)
+    with _SUGGEST_SEQ_LOCK:
+        is_stale = _SUGGEST_SEQ.get(session_key) != seq
+    if is_stale:
+        # 已有更新的输入，保持界面不变
+        return gr.Dropdown(), gr.Textbox()
+
+    return get_cn_suggestions(cn_partial_input)
+
+
+@lru_cache(maxsize=4096)
+def _cn_list_to_en_tags(cn_terms: frozenset) -> frozenset:
+    """
+    (新) 缓存的 DICTIONARY_MANAGER.get_search_tags_from_cn_list()。
+    拖动分数滑块时会以相同的中文标签重复搜索；词典只在启动时加载，缓存无需失效。
+    """
+    return frozenset(DICTIONARY_MANAGER.get_search_tags_from_cn_list(list(cn_terms)))
+
+@lru_cache(maxsize=8)
+def _full_gallery(version: int, min_score: float, max_score: float) -> Tuple[Tuple[Tuple[str, str], ...], Tuple[Dict, ...], Dict[int, str]]:
+    """
+    (新) 未设置任何搜索条件时的完整图库: (图库数据, 原始结果, 图库路径映射)。
+    与 _suggest 相同，version 只作为缓存键 (传入 _TAGS_VERSION)；
+    启动时的初始加载和只拖动分数滑块的操作都会命中这里。
+    """
+    with _INDEX_LOCK:
+        row_items = _ROW_ITEMS
+        all_tag_ids, all_scores, offsets = _ALL_TAG_IDS, _ALL_SCORES, _OFFSETS
+
+    # 显示全部：只要有一个标签在分数范围内即可 (与通用路径的判定完全相同)
+    rows = np.arange(len(row_items), dtype=np.int64)
+    hits = _filter_rows(
+        all_tag_ids, all_scores, offsets, rows,
+        np.float32(min_score), np.float32(max_score), np.empty(0, dtype=np.int32), True
+    )
+    items = tuple(row_items[row] for row in rows[hits].tolist())
+    output_data = tuple((item['file_path'], item['_basename']) for item in items)
+    gallery_state = {i: item['file_path'] for i, item in enumerate(items)}
+    return output_data, items, gallery_state
+
 def search_images_wrapper(
     cn_partial_input: str, 
     cn_selected_tag: Optional[str], 
@@ -280,19 +758,18 @@ def search_images_wrapper(
         search_msg_parts.append(f"中文精确: '{cn_selected_tag}'")
     elif cn_partial_input:
         # 模式 B: 用户提供了模糊输入，但未选择 -> 搜索所有模糊匹配
-        allowed_en_tags = DB_MANAGER.get_all_indexed_tags()
-        fuzzy_matches = DICTIONARY_MANAGER.fuzzy_lookup_suggestions(cn_partial_input, allowed_en_tags=allowed_en_tags)
+        fuzzy_matches = list(_suggest(cn_partial_input, _TAGS_VERSION) or ())
         cn_terms_to_search = fuzzy_matches
         search_msg_parts.append(f"中文模糊: '{cn_partial_input}' (匹配 {len(fuzzy_matches)} 个)")
     
     # cn_search_tags: 从中文精确匹配转换来的 "英文标签" 集合
-    cn_search_tags = set(DICTIONARY_MANAGER.get_search_tags_from_cn_list(cn_terms_to_search))
+    cn_search_tags = _cn_list_to_en_tags(frozenset(cn_terms_to_search))
 
     # 3. ----- 确定英文搜索标签 (模糊匹配) -----
     # en_fuzzy_terms: 从英文输入框解析出的 "英文模糊词" 列表
     en_fuzzy_terms: List[str] = []
     if english_input:
-        en_fuzzy_terms = [t.strip() for t in english_input.replace(",", " ").split() if t.strip()]
+        en_fuzzy_terms = [t for t in _TOKEN_SPLIT.split(english_input.translate(_COMMA_TO_SPACE).strip()) if t]
         search_msg_parts.append(f"英文模糊: {en_fuzzy_terms}")
 
     # 4. ----- 检查是否为失败的搜索 -----
@@ -301,88 +778,79 @@ def search_images_wrapper(
         final_message = f"未找到 '{cn_partial_input}' 对应的任何标签。显示 0 个结果。"
         return [], final_message, gr.Dropdown(choices=[], value=None), [], {}, None
 
-    # 5. ----- 获取基础数据 -----
-    all_images_data = DB_MANAGER.get_all_indexed_images()
+    # 5. ----- 获取基础数据 (读取内存索引快照) -----
+    with _INDEX_LOCK:
+        tags_version = _TAGS_VERSION
+        tag_index, tag_to_id, row_of_id, row_items = _TAG_INDEX, _TAG_TO_ID, _ROW_OF_ID, _ROW_ITEMS
+        favorites_bitmap = _FAVORITES_BITMAP
+        all_tag_ids, all_scores, offsets = _ALL_TAG_IDS, _ALL_SCORES, _OFFSETS
+        all_tag_names, trigram_index = _ALL_TAG_NAMES, _TRIGRAM_INDEX
     
     output_data = []
     filtered_raw_results = [] # 存储过滤后的完整数据
     
-    if not all_images_data:
+    if not row_items:
         return [], "数据库为空。请先扫描图片。", gr.Dropdown(choices=[], value=None), [], {}, None
 
-    # 6. ----- 在 Python 中执行过滤循环 -----
-    for item in all_images_data:
-        
-        # 过滤器 1: 收藏夹
-        if show_favorites and not item['is_favorite']:
-            continue # 如果要求收藏，但这张不是，则跳过
-
-        # 过滤器 2: 文件名
-        if file_name_input and file_name_input not in item['file_path'].lower():
-            continue # 如果提供了文件名，但不匹配，则跳过
-
-        # 过滤器 3: 标签和分数
-        
-        if not cn_search_tags and not en_fuzzy_terms:
-            # 这种情况 = (仅文件名搜索) 或 (仅收藏搜索) 或 (显示全部)
-            
-            if not user_intended_search:
-                # 显示所有图片 (需要应用分数范围)
-                tags_in_range = [
-                    f"{t['tag_name']} ({t['score']:.2f})" 
-                    for t in item['tags'] 
-                    if min_score <= t['score'] <= max_score
-                ]
-                
-                if not tags_in_range:
-                    continue 
-                
-                title = f"{os.path.basename(item['file_path'])}\n\n高分标签:\n" + "\n".join(tags_in_range[:5]) + "..."
-            
-            else:
-                # 这种情况 = 仅文件名/收藏夹搜索 (显示所有标签)
-                all_tags = [f"{t['tag_name']} ({t['score']:.2f})" for t in item['tags']]
-                title = f"{os.path.basename(item['file_path'])}\n\n所有标签:\n" + "\n".join(all_tags[:5]) + "..."
-            
-            output_data.append((item['file_path'], title))
-            filtered_raw_results.append(item)
-            continue
-
-        # --- 如果执行到这里，说明用户 *确实* 输入了标签 (cn or en) ---
-
-        matched_tags = [] # 存储这张图片上匹配的标签
+    # (新) 快速路径: 没有任何搜索条件时 (例如初始加载)，直接使用按索引版本缓存的完整图库
+    if not user_intended_search:
+        cached_output, cached_items, cached_state = _full_gallery(tags_version, float(min_score), float(max_score))
+        final_message = f"显示所有 {len(cached_output)} 张图片 (分数范围 {min_score:.1f} ~ {max_score:.1f})。"
+        # 返回副本，避免调用方修改缓存
+        return list(cached_output), final_message, gr.Dropdown(choices=[], value=None), list(cached_items), dict(cached_state), None
+
+    # 6. ----- 通过倒排索引确定候选图片 (以行号表示；行号顺序即 image_id 顺序) -----
+    # en_matched_tags: 包含任一英文模糊词的标签名 (只需遍历一次标签词表)
+    en_matched_tags: Set[str] = set()
+    if en_fuzzy_terms:
+        en_matched_tags = _match_en_fuzzy_tags(en_fuzzy_terms, all_tag_names, trigram_index)
+
+    has_tag_query = bool(cn_search_tags or en_fuzzy_terms)
+    if has_tag_query:
+        # 只有出现过这些标签的图片才可能匹配
+        candidate_ids: Set[int] = set()
+        for tag_name in cn_search_tags | en_matched_tags:
+            candidate_ids |= tag_index.get(tag_name, set())
+        rows = np.fromiter((row_of_id[i] for i in candidate_ids), dtype=np.int64, count=len(candidate_ids))
+        rows.sort()
+    else:
+        rows = np.arange(len(row_items), dtype=np.int64)
 
-        for tag_info in item['tags']:
-            tag_name = tag_info['tag_name']
-            score = tag_info['score']
-            
-            # 检查分数范围
-            if not (min_score <= score <= max_score):
-                continue 
+    # 过滤器 1: 收藏夹 (位图展开为布尔掩码后一次性筛选)
+    if show_favorites:
+        favorite_mask = np.unpackbits(favorites_bitmap, count=len(row_items), bitorder='little').view(np.bool_)
+        rows = rows[favorite_mask[rows]]
 
-            is_match = False
-            
-            # 检查是否匹配中文精确搜索
-            if tag_name in cn_search_tags:
-                matched_tags.append(f"{tag_name} [中] ({score:.2f})")
-                is_match = True
-
-            # 检查是否匹配英文模糊搜索
-            # (如果已匹配中文，则不再检查英文，避免重复)
-            if not is_match:
-                for term in en_fuzzy_terms:
-                    if term in tag_name:
-                        matched_tags.append(f"{tag_name} [英] ({score:.2f})")
-                        break # 只要一个模糊词匹配就行
-
-        # --- 循环结束 ---
-        
-        if matched_tags:
-            title = f"{os.path.basename(item['file_path'])}\n\n匹配的标签:\n" + "\n".join(matched_tags)
-            output_data.append((item['file_path'], title))
-            filtered_raw_results.append(item)
+    # 过滤器 2: 文件名
+    if file_name_input:
+        rows = np.array(
+            [row for row in rows.tolist() if file_name_input in row_items[row]['_basename_lower']],
+            dtype=np.int64
+        )
 
-    # 7. ----- 返回结果 -----
+    # 7. ----- 过滤器 3: 标签和分数 -----
+    # (新) 图库标题只显示文件名；完整的标签信息在选中图片时才生成 (见 on_gallery_select)
+    if not has_tag_query and user_intended_search:
+        # 这种情况 = 仅文件名/收藏夹搜索 (不应用分数范围)
+        hit_rows = rows
+    else:
+        # 将查询标签转换为整数 ID 数组 (每次查询只转换一次)
+        query_ids = {tag_to_id[t] for t in cn_search_tags | en_matched_tags if t in tag_to_id}
+        query_ids_sorted = np.array(sorted(query_ids), dtype=np.int32)
+        # 分数以 float32 存储，边界也转换为 float32 以保证比较一致
+        lo = np.float32(min_score)
+        hi = np.float32(max_score)
+
+        # has_tag_query 为 False 时 = 显示全部：只要有一个标签在分数范围内即可
+        hits = _filter_rows(all_tag_ids, all_scores, offsets, rows, lo, hi, query_ids_sorted, not has_tag_query)
+        hit_rows = rows[hits]
+
+    for row in hit_rows.tolist():
+        item = row_items[row]
+        output_data.append((item['file_path'], item['_basename']))
+        filtered_raw_results.append(item)
+
+    # 8. ----- 返回结果 -----
     
     # (新) 构建图库路径映射 (index -> file_path)
     # 这对于 'open_image_file' 和 'on_gallery_select' 至关重要
@@ -485,13 +953,10 @@ def on_gallery_select(
     fav_btn_variant = "primary" if is_fav else "secondary"
     
     # --- 2. 更新标签 Radio ---
-    sorted_tags = sorted(selected_item['tags'], key=lambda x: x['score'], reverse=True)
+    sorted_tags = sorted(_get_item_tags(selected_item['image_id']), key=lambda x: x[1], reverse=True)
     
     tag_choices = []
-    for tag_info in sorted_tags:
-        en_tag = tag_info['tag_name']
-        score = tag_info['score']
-        
+    for en_tag, score in sorted_tags:
         cn_tag = DICTIONARY_MANAGER.lookup_en_to_cn(en_tag)
         
         if cn_tag:
@@ -502,7 +967,8 @@ def on_gallery_select(
         tag_choices.append(display_text)
 
     # (新) 返回 selected_item 以更新状态
-    return gr.Button(fav_btn_text, variant=fav_btn_variant), gr.Radio(choices=tag_choices, value=None, visible=True), selected_item
+    tag_label = f"{os.path.basename(selected_item['file_path'])} 的标签 (点击可搜索)"
+    return gr.Button(fav_btn_text, variant=fav_btn_variant), gr.Radio(choices=tag_choices, value=None, visible=True, label=tag_label), selected_item
 
 
 def on_favorite_button_click(
@@ -527,6 +993,16 @@ def on_favorite_button_click(
         # 更新内存中的状态 (gr.State 和 完整列表)
         selected_item['is_favorite'] = new_status
         
+        # (新) 同步内存搜索索引 (翻转收藏位图中的一位)
+        with _INDEX_LOCK:
+            row = _ROW_OF_ID.get(image_id)
+            if row is not None:
+                _ROW_ITEMS[row]['is_favorite'] = new_status
+                if new_status:
+                    _FAVORITES_BITMAP[row >> 3] |= np.uint8(1 << (row & 7))
+                else:
+                    _FAVORITES_BITMAP[row >> 3] &= np.uint8(~(1 << (row & 7)) & 0xFF)
+        
         # (新) 在 'current_results_state' 中找到并更新
         for item in current_results_state:
             if item['image_id'] == image_id:
@@ -637,6 +1113,10 @@ def on_tag_select_and_search(
 
 # --- 启动时加载配置 ---
 load_config()
+rebuild_search_index()
+warm_up_filter_kernel()
+if SCAN_ENGINE is not None:
+    threading.Thread(target=_scan_worker, daemon=True).start()
 
 
 # --- Gradio 界面定义 ---
@@ -805,10 +1285,11 @@ with gr.Blocks(title="illuTag - 图像索引与搜索工具", css=custom_css) as
     )
 
     cn_partial_input.change(
-        fn=get_cn_suggestions,
+        fn=get_cn_suggestions_debounced, # (新) 防抖，合并快速连续的按键
         inputs=[cn_partial_input],
         outputs=[cn_suggestion_dropdown, cn_suggestion_msg],
-        queue=False 
+        queue=False,
+        trigger_mode="always_last"
     )
     
     cn_suggestion_dropdown.focus(
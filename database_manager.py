@@ -1,12 +1,60 @@
 import sqlite3
 import os
-from typing import List, Dict, Tuple, Optional, Set 
+import hashlib
+import threading
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, FrozenSet
 from datetime import datetime
 
 # --- 配置常量 ---
 DATABASE_FILE = "illutag_data.db"
 IMAGE_TABLE = "images"
 TAGS_TABLE = "tags"
+UNIQUE_TAGS_TABLE = "unique_tags" # (新) 去重后的标签名及引用次数，由触发器维护
+META_TABLE = "db_meta" # (新) 单行表，保存持久化的数据版本号
+
+# (新) SQLite 3.35 起支持 RETURNING，upsert 后可直接取回 image_id
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# (新) 大批量读取时游标每次从 SQLite 取出的行数
+STREAM_ARRAYSIZE = 10000
+
+# (新) 每个连接建立后执行的 PRAGMA (journal_mode=WAL 是持久化的，只在初始化时设置一次)
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL;",     # WAL 模式下每次提交只需一次 fsync
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-65536;",      # 64 MB 页缓存
+    "PRAGMA mmap_size=268435456;",    # 256 MB 内存映射读取
+    "PRAGMA busy_timeout=5000;",      # 遇到写锁时最多等待 5 秒，而不是立即报错
+)
+
+# (新) 每个连接缓存的预编译语句数 (sqlite3 默认只有 128)
+STATEMENT_CACHE_SIZE = 512
+
+# (新) 高频语句集中定义为常量：SQL 文本完全相同，连接的语句缓存才能命中，省去每次的解析和查询规划
+SQL_GET_PATHS = f"SELECT file_path FROM {IMAGE_TABLE}"
+SQL_INSERT_IMAGE = f"INSERT INTO {IMAGE_TABLE} (file_path, date_scanned, tags_hash) VALUES (?, ?, ?)"
+SQL_UPSERT_IMAGE = f"""
+    INSERT INTO {IMAGE_TABLE} (file_path, date_scanned)
+    VALUES (?, ?)
+    ON CONFLICT(file_path) DO UPDATE SET date_scanned=excluded.date_scanned
+"""
+# 返回的 tags_hash 是更新前的值 (upsert 不修改该列)，新插入的行为 NULL
+SQL_UPSERT_IMAGE_RETURNING = SQL_UPSERT_IMAGE + " RETURNING image_id, tags_hash"
+SQL_GET_IMAGE_ID = f"SELECT image_id, tags_hash FROM {IMAGE_TABLE} WHERE file_path = ?"
+SQL_SET_TAGS_HASH = f"UPDATE {IMAGE_TABLE} SET tags_hash = ? WHERE image_id = ?"
+SQL_DELETE_TAGS = f"DELETE FROM {TAGS_TABLE} WHERE image_id = ?"
+SQL_INSERT_TAG = f"INSERT INTO {TAGS_TABLE} (image_id, tag_name, score) VALUES (?, ?, ?)"
+# (新) 每个写事务提交前递增数据版本号，与数据修改在同一事务中生效
+SQL_BUMP_DATA_VERSION = f"UPDATE {META_TABLE} SET data_version = data_version + 1 WHERE id = 0"
+
+def _tags_fingerprint(tags: List[Dict]) -> str:
+    """
+    (新) 计算标签集合的指纹 (与顺序无关)。重新扫描得到的标签和分数与库中完全一致时，
+    指纹相同，可以跳过删除和重新插入。
+    """
+    payload = ','.join(sorted(f"{tag['tag_name']}:{tag['score']:.6f}" for tag in tags))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
 
 class DatabaseManager:
     """
@@ -18,14 +66,53 @@ class DatabaseManager:
         初始化数据库管理器，并连接到指定的 SQLite 文件。
         """
         self.db_path = db_path
+        # (新) 线程本地的连接池：每个线程缓存一个读写连接 (conn) 和一个只读连接 (read_conn)。
+        # SQLite 连接不能跨线程共享，但同一线程内可以反复使用；线程结束时连接随之释放
+        self._tls = threading.local()
+        # (新) 数据版本号：每次成功写入 (标签或收藏状态) 后递增，用于使读缓存失效
+        self._db_version = 0
+        self._indexed_count_cache: Optional[Tuple[int, int]] = None # (版本号, 数量)
+        self._tags_cache: Optional[Tuple[int, FrozenSet[str]]] = None       # (新) (版本号, 标签集合)
         self._initialize_db_structure() # 确保在应用启动时创建表结构
 
     def _get_connection(self) -> sqlite3.Connection:
         """
-        [线程安全] 创建一个新的数据库连接。
+        [线程安全] (新) 获取当前线程专用的数据库连接 (首次调用时创建并缓存)。
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = getattr(self._tls, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._tls.conn = conn
+        elif conn.in_transaction:
+            # 上一次调用因非数据库异常中断，遗留了未结束的事务
+            conn.rollback()
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        """(新) 创建一个新的读写连接并设置 PRAGMA。"""
+        conn = sqlite3.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
         conn.row_factory = sqlite3.Row
+        self._apply_pragmas(conn)
+        return conn
+
+    @staticmethod
+    def _apply_pragmas(conn: sqlite3.Connection):
+        """(新) 为新建的连接设置性能相关的 PRAGMA。"""
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
+    def _get_read_connection(self) -> sqlite3.Connection:
+        """
+        [线程安全] (新) 获取当前线程专用的只读连接 (首次调用时创建并缓存)。
+        只读连接不会申请写锁，UI 的轮询查询不会阻塞扫描线程的写入。
+        """
+        conn = getattr(self._tls, 'read_conn', None)
+        if conn is None:
+            uri = Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE)
+            conn.row_factory = sqlite3.Row
+            self._apply_pragmas(conn)
+            self._tls.read_conn = conn
         return conn
 
     def _initialize_db_structure(self):
@@ -37,6 +124,9 @@ class DatabaseManager:
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
+
+            # (新) WAL 模式：扫描线程写入时，UI 的读取不会被阻塞 (该设置保存在数据库文件中)
+            cursor.execute("PRAGMA journal_mode=WAL;")
             
             # 1. 创建 Images 表
             cursor.execute(f"""
@@ -44,7 +134,8 @@ class DatabaseManager:
                     image_id INTEGER PRIMARY KEY AUTOINCREMENT,
                     file_path TEXT UNIQUE NOT NULL,
                     date_scanned TEXT,
-                    is_favorite INTEGER DEFAULT 0
+                    is_favorite INTEGER DEFAULT 0,
+                    tags_hash TEXT
                 );
             """)
 
@@ -55,6 +146,12 @@ class DatabaseManager:
             except sqlite3.OperationalError:
                 # 列已存在，忽略错误
                 pass
+            # (新) 标签集合指纹，重新扫描时用于跳过没有变化的图片
+            try:
+                cursor.execute(f"ALTER TABLE {IMAGE_TABLE} ADD COLUMN tags_hash TEXT")
+                print("数据库更新：已成功添加 'tags_hash' 列。")
+            except sqlite3.OperationalError:
+                pass
             # --- 更新结束 ---
             
             # 2. 创建 Tags 表 (包含对 Images 表的外键引用)
@@ -68,123 +165,307 @@ class DatabaseManager:
                 );
             """)
             
-            # 创建索引，用于加速标签搜索
-            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tag_name ON {TAGS_TABLE} (tag_name);")
-            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_score ON {TAGS_TABLE} (score);")
+            # (新) 持久化的数据版本号 (跨进程有效，供搜索索引的磁盘缓存判断是否过期)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {META_TABLE} (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    data_version INTEGER NOT NULL
+                );
+            """)
+            cursor.execute(f"INSERT OR IGNORE INTO {META_TABLE} (id, data_version) VALUES (0, 0);")
+            # (新) 去重标签表，避免每次获取标签集合都扫描整个 tags 表
+            self._create_unique_tags(cursor)
+
+            # (新) 标签搜索完全在内存索引中进行，没有按标签名或分数查询 tags 表的 SQL；
+            # 旧版本为搜索创建的索引只会增加扫描写入的开销，全部删除
+            for old_index in ("idx_tag_name", "idx_score"):
+                cursor.execute(f"DROP INDEX IF EXISTS {old_index};")
             
             conn.commit()
+
+            # (新) 为查询优化器收集统计信息。只在尚无统计表时执行一次，避免每次启动都扫描全表
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                cursor.execute("ANALYZE;")
+                conn.commit()
             print(f"数据库结构初始化成功，文件: {self.db_path}")
 
         except sqlite3.Error as e:
             print(f"数据库结构初始化失败: {e}")
-        finally:
-            if conn:
+
+    def _create_unique_tags(self, cursor: sqlite3.Cursor):
+        """
+        (新) 创建 unique_tags (标签名 -> 引用次数) 及同步触发器。
+        WITHOUT ROWID 表直接按标签名有序存储；首次创建时从已有数据回填，之后由触发器增量维护。
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (UNIQUE_TAGS_TABLE,))
+        if cursor.fetchone() is None:
+            cursor.execute(f"""
+                CREATE TABLE {UNIQUE_TAGS_TABLE} (
+                    tag_name TEXT PRIMARY KEY,
+                    ref_count INTEGER NOT NULL DEFAULT 0
+                ) WITHOUT ROWID;
+            """)
+            cursor.execute(f"""
+                INSERT INTO {UNIQUE_TAGS_TABLE} (tag_name, ref_count)
+                SELECT tag_name, COUNT(*) FROM {TAGS_TABLE} GROUP BY tag_name;
+            """)
+            print("数据库更新：已为现有标签建立去重标签表 (unique_tags)。")
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS unique_tags_ai AFTER INSERT ON {TAGS_TABLE} BEGIN
+                INSERT INTO {UNIQUE_TAGS_TABLE} (tag_name, ref_count) VALUES (new.tag_name, 1)
+                ON CONFLICT(tag_name) DO UPDATE SET ref_count = ref_count + 1;
+            END;
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS unique_tags_ad AFTER DELETE ON {TAGS_TABLE} BEGIN
+                UPDATE {UNIQUE_TAGS_TABLE} SET ref_count = ref_count - 1 WHERE tag_name = old.tag_name;
+                DELETE FROM {UNIQUE_TAGS_TABLE} WHERE tag_name = old.tag_name AND ref_count <= 0;
+            END;
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS unique_tags_au AFTER UPDATE OF tag_name ON {TAGS_TABLE} BEGIN
+                UPDATE {UNIQUE_TAGS_TABLE} SET ref_count = ref_count - 1 WHERE tag_name = old.tag_name;
+                DELETE FROM {UNIQUE_TAGS_TABLE} WHERE tag_name = old.tag_name AND ref_count <= 0;
+                INSERT INTO {UNIQUE_TAGS_TABLE} (tag_name, ref_count) VALUES (new.tag_name, 1)
+                ON CONFLICT(tag_name) DO UPDATE SET ref_count = ref_count + 1;
+            END;
+        """)
+
+    def close_thread(self):
+        """(新) 关闭当前线程缓存的连接。之后在该线程中的调用会重新建立连接。"""
+        for name in ('conn', 'read_conn'):
+            conn = getattr(self._tls, name, None)
+            if conn is not None:
                 conn.close()
+                setattr(self._tls, name, None)
 
     def close(self):
         """
-        移除 close 方法中关闭连接的逻辑，因为连接现在是按需创建和关闭的。
+        关闭调用线程的连接。其他线程的连接在线程结束时随线程本地存储一起释放。
         """
-        print("DatabaseManager 关闭完成 (连接已按需管理)。")
+        self.close_thread()
+        print("DatabaseManager 关闭完成 (连接已按线程管理)。")
 
-    def get_all_indexed_file_paths(self) -> Set[str]:
+    def get_all_indexed_file_paths(self) -> FrozenSet[str]:
         """
         [线程安全] 获取数据库中所有已索引图片的完整文件路径集合。
         用于在扫描时判断文件是否需要跳过。
+        (新) 不做缓存：唯一的调用方是扫描开始时的一次查询，集合与图库规模成正比，
+        扫描结束后就应当释放，而不是在整个进程生命周期内常驻内存。
         """
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
+            # (新) 逐行读取普通元组 (不构造 sqlite3.Row，也不先 fetchall 出完整列表)
+            cursor.row_factory = None
+            cursor.arraysize = STREAM_ARRAYSIZE
 
-            sql_query = f"""
-                SELECT file_path FROM {IMAGE_TABLE};
-            """
-
-            cursor.execute(sql_query)
-            results = cursor.fetchall()
+            cursor.execute(SQL_GET_PATHS)
 
             # 规范化路径，确保与文件系统读取的路径格式一致，便于 Set 查找
-            return {os.path.normpath(row['file_path']) for row in results}
+            return frozenset(os.path.normpath(file_path) for (file_path,) in cursor)
 
         except sqlite3.Error as e:
             print(f"获取所有索引文件路径失败: {e}")
-            return set()
-        finally:
-            if conn: conn.close()
+            return frozenset()
             
-    def save_tags_to_db(self, file_path: str, tags: List[Dict]) -> bool:
+    def _insert_tag_rows(self, cursor: sqlite3.Cursor, image_id: int, tags: List[Dict]):
+        """
+        (新) 插入一张图片的标签记录 (不提交)。
+        """
+        tag_data = [(image_id, tag['tag_name'], tag['score']) for tag in tags]
+        if tag_data:
+            cursor.executemany(SQL_INSERT_TAG, tag_data)
+
+    def _insert_new_image_tags(self, cursor: sqlite3.Cursor, normalized_path: str, tags: List[Dict], now: str, tags_hash: str) -> bool:
+        """
+        (新) 新图片的快速路径：一条普通 INSERT 加上标签的 executemany，
+        省去 upsert 冲突处理和对空标签集合的 DELETE。
+        路径其实已存在时返回 False (只有这条语句被中止，事务不受影响)，由调用方改走 upsert。
+        """
+        try:
+            cursor.execute(SQL_INSERT_IMAGE, (normalized_path, now, tags_hash))
+        except sqlite3.IntegrityError:
+            return False
+        self._insert_tag_rows(cursor, cursor.lastrowid, tags)
+        return True
+
+    def _write_image_tags(self, cursor: sqlite3.Cursor, file_path: str, tags: List[Dict], now: str, file_path_is_normalized: bool = False, is_new: bool = False):
+        """
+        (新) 在调用方已开启的事务中写入单张图片的标签 (不提交)。
+        is_new: 调用方认为该图片尚未入库时传入 True，优先走快速插入路径。
+        """
+        # 使用 os.path.normpath 确保数据库中存储的路径格式一致 (调用方已规范化时跳过)
+        normalized_path = file_path if file_path_is_normalized else os.path.normpath(file_path)
+        tags_hash = _tags_fingerprint(tags)
+        if is_new and self._insert_new_image_tags(cursor, normalized_path, tags, now, tags_hash):
+            return
+
+        # 1. 插入或更新 Images 表 (获取 image_id 和原有的标签指纹)
+        if SUPPORTS_RETURNING:
+            # 一条语句完成插入/更新并返回 image_id
+            cursor.execute(SQL_UPSERT_IMAGE_RETURNING, (normalized_path, now))
+            image_id, old_hash = cursor.fetchone()
+        else:
+            cursor.execute(SQL_UPSERT_IMAGE, (normalized_path, now))
+            # 获取插入或更新后的 image_id
+            cursor.execute(SQL_GET_IMAGE_ID, (normalized_path,))
+            image_id, old_hash = cursor.fetchone()
+
+        # (新) 标签没有变化：只更新扫描时间 (上面的 upsert 已完成)，跳过删除和重新插入
+        if old_hash == tags_hash:
+            return
+
+        # 2. 删除该图片所有旧的标签记录 (处理重新扫描)
+        cursor.execute(SQL_DELETE_TAGS, (image_id,))
+        
+        # 3. 插入新的标签记录
+        self._insert_tag_rows(cursor, image_id, tags)
+        cursor.execute(SQL_SET_TAGS_HASH, (tags_hash, image_id))
+
+    def save_tags_to_db(self, file_path: str, tags: List[Dict], file_path_is_normalized: bool = False) -> bool:
         """
         [线程安全] 将单张图片的标签数据保存到数据库。
+        (新) file_path_is_normalized: 调用方保证路径已经过 os.path.normpath 时传入 True。
         """
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            
-            # 开启事务
-            conn.execute("BEGIN TRANSACTION;")
 
-            # 1. 插入或更新 Images 表 (获取 image_id)
-            now = datetime.now().isoformat()
-            
-            # 使用 os.path.normpath 确保数据库中存储的路径格式一致
-            normalized_path = os.path.normpath(file_path)
+            # (新) 不手动 BEGIN：sqlite3 会在第一条写语句前自动开启事务，写锁在真正写入时才申请
+            self._write_image_tags(cursor, file_path, tags, datetime.now().isoformat(), file_path_is_normalized)
+            cursor.execute(SQL_BUMP_DATA_VERSION)
+
+            conn.commit()
+            self._db_version += 1
+            return True
             
-            cursor.execute(f"""
-                INSERT INTO {IMAGE_TABLE} (file_path, date_scanned)
-                VALUES (?, ?)
-                ON CONFLICT(file_path) DO UPDATE SET date_scanned=excluded.date_scanned
-            """, (normalized_path, now))
+        except sqlite3.Error as e:
+            if conn: conn.rollback()
+            print(f"保存数据失败 (文件: {file_path}): {e}")
+            return False
 
-            # 获取插入或更新后的 image_id
-            cursor.execute(f"SELECT image_id FROM {IMAGE_TABLE} WHERE file_path = ?", (normalized_path,))
-            image_id = cursor.fetchone()[0]
+    def insert_new_image_with_tags(self, file_path: str, tags: List[Dict], file_path_is_normalized: bool = False) -> bool:
+        """
+        [线程安全] (新) 保存一张尚未入库的图片及其标签 (跳过 upsert 和 DELETE)。
+        路径已经存在时自动退回普通的更新流程。
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
 
-            # 2. 删除该图片所有旧的标签记录 (处理重新扫描)
-            cursor.execute(f"DELETE FROM {TAGS_TABLE} WHERE image_id = ?", (image_id,))
-            
-            # 3. 插入新的标签记录
-            tag_data = [(image_id, tag['tag_name'], tag['score']) for tag in tags]
-            if tag_data:
-                cursor.executemany(f"""
-                    INSERT INTO {TAGS_TABLE} (image_id, tag_name, score)
-                    VALUES (?, ?, ?)
-                """, tag_data)
+            # 与 save_tags_to_db 相同，依赖 sqlite3 在第一条写语句前自动开启的事务
+            self._write_image_tags(cursor, file_path, tags, datetime.now().isoformat(), file_path_is_normalized, is_new=True)
+            cursor.execute(SQL_BUMP_DATA_VERSION)
 
             conn.commit()
+            self._db_version += 1
             return True
             
         except sqlite3.Error as e:
             if conn: conn.rollback()
             print(f"保存数据失败 (文件: {file_path}): {e}")
             return False
-        finally:
-            if conn: conn.close()
             
-    def get_all_indexed_tags(self) -> Set[str]:
+    def bulk_save_tags(self, items: List[Tuple[str, List[Dict]]], file_path_is_normalized: bool = False, new_images: bool = False) -> bool:
+        """
+        [线程安全] (新) 在同一个事务中保存多张图片的标签 (每项为 (文件路径, 标签列表))。
+        整批只提交一次 (一次 fsync)；任何一张失败都会回滚整批并返回 False。
+        (新) new_images: 调用方已确认这些图片不在数据库中 (增量扫描) 时传入 True，走快速插入路径。
+        """
+        if not items:
+            return True
+
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            
+            # 立即获取写锁，避免事务中途从读锁升级为写锁时失败
+            conn.execute("BEGIN IMMEDIATE;")
+
+            now = datetime.now().isoformat()
+            for file_path, tags in items:
+                self._write_image_tags(cursor, file_path, tags, now, file_path_is_normalized, new_images)
+            cursor.execute(SQL_BUMP_DATA_VERSION)
+
+            conn.commit()
+            self._db_version += 1
+            return True
+            
+        except sqlite3.Error as e:
+            if conn: conn.rollback()
+            print(f"批量保存数据失败 ({len(items)} 张图片): {e}")
+            return False
+
+    def get_all_indexed_tags(self) -> FrozenSet[str]:
         """
         [线程安全] 获取数据库中所有图片使用的唯一英文标签集合。
+        (新) 结果按数据版本号缓存；返回不可变集合。
+        (新) 从触发器维护的 unique_tags 表读取，只需扫描去重后的标签，而不是全部标签记录。
         """
+        version = self._db_version
+        cached = self._tags_cache
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.arraysize = STREAM_ARRAYSIZE
             
             sql_query = f"""
-                SELECT DISTINCT tag_name FROM {TAGS_TABLE};
+                SELECT tag_name FROM {UNIQUE_TAGS_TABLE};
             """
             
             cursor.execute(sql_query)
-            results = cursor.fetchall()
             
-            return {row['tag_name'] for row in results}
+            result = frozenset(tag_name for (tag_name,) in cursor)
 
         except sqlite3.Error as e:
             print(f"获取所有索引标签失败: {e}")
-            return set()
-        finally:
-            if conn: conn.close()
+            return frozenset()
+
+        self._tags_cache = (version, result)
+        return result
+
+    def get_indexed_count(self) -> int:
+        """
+        [线程安全] (新) 获取数据库中已索引图片的数量。
+        使用只读连接执行 COUNT(*)，结果按数据版本号缓存，没有新的写入时直接返回缓存值。
+        """
+        version = self._db_version
+        if self._indexed_count_cache is not None and self._indexed_count_cache[0] == version:
+            return self._indexed_count_cache[1]
+
+        try:
+            cursor = self._get_read_connection().execute(f"SELECT COUNT(*) FROM {IMAGE_TABLE}")
+            count = cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"获取索引图片数量失败: {e}")
+            return 0
+
+        self._indexed_count_cache = (version, count)
+        return count
+
+    def get_data_version(self) -> Optional[int]:
+        """
+        [线程安全] (新) 读取持久化的数据版本号。每个写事务都会在提交前递增它，
+        因此与文件的修改时间不同，检查点或 ANALYZE 等不改变数据的操作不会影响它。读取失败时返回 None。
+        """
+        try:
+            row = self._get_read_connection().execute(f"SELECT data_version FROM {META_TABLE} WHERE id = 0").fetchone()
+        except sqlite3.Error as e:
+            print(f"读取数据版本号失败: {e}")
+            return None
+        return row[0] if row else None
 
     def get_all_indexed_images(self) -> List[Dict]:
         """
@@ -235,73 +516,6 @@ class DatabaseManager:
         except sqlite3.Error as e:
             print(f"获取所有索引图片失败: {e}")
             return []
-        finally:
-            if conn: conn.close()
-
-
-    def search_images(self, search_tags: List[str], min_score: float) -> List[Dict]:
-        """
-        [线程安全] 根据多个标签和最低分数阈值搜索图片。
-        """
-        if not search_tags:
-            # 如果没有搜索标签，返回空列表，将逻辑交给 app.py 的 wrapper
-            return []
-            
-        conn = None
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # SQL 查询参数
-            tag_placeholders = ','.join(['?'] * len(search_tags))
-            
-            # 核心 SQL 逻辑：查询包含任一标签且分数满足条件的图片
-            sql_query = f"""
-                SELECT 
-                    T1.image_id, 
-                    T2.file_path,
-                    T2.is_favorite,
-                    T1.tag_name,
-                    T1.score
-                FROM {TAGS_TABLE} AS T1
-                INNER JOIN {IMAGE_TABLE} AS T2 ON T1.image_id = T2.image_id
-                WHERE 
-                    T1.tag_name IN ({tag_placeholders}) -- OR 逻辑：匹配任一标签
-                    AND T1.score >= ?
-                ORDER BY T1.image_id, T1.tag_name
-            """
-            
-            # 参数列表：[搜索标签] + [最低分]
-            params = search_tags + [min_score]
-
-            # 执行查询
-            cursor.execute(sql_query, params)
-            results = cursor.fetchall()
-            
-            # 将扁平化的结果重新整理为图片-标签结构
-            image_results: Dict[int, Dict] = {}
-            for row in results:
-                image_id = row['image_id']
-                if image_id not in image_results:
-                    image_results[image_id] = {
-                        "image_id": image_id,
-                        "file_path": row['file_path'],
-                        "is_favorite": bool(row['is_favorite']), # (新) 添加收藏状态
-                        "tags": []
-                    }
-                image_results[image_id]['tags'].append({
-                    "tag_name": row['tag_name'],
-                    "score": row['score']
-                })
-            
-            # 返回一个列表
-            return list(image_results.values())
-
-        except sqlite3.Error as e:
-            print(f"数据库搜索失败: {e}")
-            return []
-        finally:
-            if conn: conn.close()
 
     # --- (新) 收藏功能 ---
     def toggle_favorite_status(self, image_id: int) -> bool:
@@ -324,8 +538,10 @@ class DatabaseManager:
             # 2. 获取新状态
             cursor.execute(f"SELECT is_favorite FROM {IMAGE_TABLE} WHERE image_id = ?", (image_id,))
             new_status = cursor.fetchone()
+            cursor.execute(SQL_BUMP_DATA_VERSION)
             
             conn.commit()
+            self._db_version += 1
             
             if new_status:
                 return bool(new_status['is_favorite'])
@@ -334,6 +550,4 @@ class DatabaseManager:
         except sqlite3.Error as e:
             if conn: conn.rollback()
             print(f"切换收藏状态失败 (Image ID: {image_id}): {e}")
-            return False
-        finally:
-            if conn: conn.close()
\ No newline at end of file
+            return False
\ No newline at end of file
@@ -4,6 +4,8 @@ from typing import List, Dict, Set, Optional
 
 # --- 配置常量 ---
 DICTIONARY_FILE = "dictionary01.xlsx"
+# (新) 清洗后的词典缓存 (与 Excel 同名，扩展名不同)。按顺序尝试：Parquet 需要 pyarrow，不可用时退回 CSV
+DICTIONARY_CACHE_FORMATS = ('.parquet', '.csv')
 
 class DictionaryManager:
     """
@@ -28,6 +30,10 @@ class DictionaryManager:
         
         # 所有在词典中出现的、用于模糊搜索的精确中文标签
         self._all_cn_tags: List[str] = []
+
+        # (新) 模糊搜索用的倒排索引 (值为 _all_cn_tags 中的下标)
+        self._char_index: Dict[str, List[int]] = {}    # 单字 -> 包含该字的标签 (下标升序)
+        self._bigram_index: Dict[str, Set[int]] = {}   # 相邻两字 -> 包含该二元组的标签
         
         self._load_dictionary()
 
@@ -40,30 +46,35 @@ class DictionaryManager:
             return
             
         try:
-            # 只读取 C (索引 2) 和 D (索引 3) 列
-            # 注意: header=None 从第 0 行开始读取
-            self._df = pd.read_excel(self.dict_path, header=None, sheet_name=0, usecols=[2, 3])
-            
-            # 重命名列
-            self._df.rename(columns={2: 'tag', 3: 'right_tag_cn'}, inplace=True)
-            
-            # 清理数据
-            self._df.dropna(subset=['tag', 'right_tag_cn'], inplace=True)
-            self._df['tag'] = self._df['tag'].astype(str).str.strip().str.lower()
-            self._df['right_tag_cn'] = self._df['right_tag_cn'].astype(str).str.strip()
+            # (新) 优先读取比 Excel 新的缓存，跳过解析 xlsx 和数据清洗
+            self._df = self._read_cache()
+            if self._df is None:
+                # 只读取 C (索引 2) 和 D (索引 3) 列
+                # 注意: header=None 从第 0 行开始读取
+                self._df = pd.read_excel(self.dict_path, header=None, sheet_name=0, usecols=[2, 3])
+                
+                # 重命名列
+                self._df.rename(columns={2: 'tag', 3: 'right_tag_cn'}, inplace=True)
+                
+                # 清理数据
+                self._df.dropna(subset=['tag', 'right_tag_cn'], inplace=True)
+                self._df['tag'] = self._df['tag'].astype(str).str.strip().str.lower()
+                self._df['right_tag_cn'] = self._df['right_tag_cn'].astype(str).str.strip()
+                self._write_cache(self._df)
             
             # 构建 CN -> EN 和 EN -> CN 映射
-            for cn_tag, en_tag in zip(self._df['right_tag_cn'], self._df['tag']):
-                # 如果有重复，后面的会覆盖前面的
-                self._cn_to_en_tag[cn_tag] = en_tag
-                
-                # (新) 构建反向映射
-                # 注意：如果一个 EN 标签对应多个 CN 翻译，这里只会保留最后一个
-                self._en_to_cn_tag[en_tag] = cn_tag
+            # (新) 用 dict(zip(...)) 一次性构建 (在 C 层完成)，与逐行赋值一样：如果有重复，后面的会覆盖前面的
+            cn_tags = self._df['right_tag_cn'].tolist()
+            en_tags = self._df['tag'].tolist()
+            self._cn_to_en_tag = dict(zip(cn_tags, en_tags))
+            
+            # (新) 构建反向映射
+            # 注意：如果一个 EN 标签对应多个 CN 翻译，这里只会保留最后一个
+            self._en_to_cn_tag = dict(zip(en_tags, cn_tags))
 
             # 构建所有精确中文标签列表 (用于后续的模糊搜索)
             self._all_cn_tags = list(self._cn_to_en_tag.keys())
-
+            self._build_ngram_index()
 
             print(f"成功加载词典 {self.dict_path}，包含 {len(self._all_cn_tags)} 个精确中文标签。")
             
@@ -72,6 +83,90 @@ class DictionaryManager:
         except Exception as e:
             print(f"加载词典文件失败: {e}")
             
+    def _cache_paths(self) -> List[str]:
+        """(新) 按优先顺序返回可能的词典缓存文件路径。"""
+        base = os.path.splitext(self.dict_path)[0]
+        return [base + ext for ext in DICTIONARY_CACHE_FORMATS]
+
+    def _read_cache(self) -> Optional[pd.DataFrame]:
+        """
+        (新) 读取比 Excel 词典更新的缓存 (只含清洗后的 'tag' 和 'right_tag_cn' 两列)。
+        没有可用的缓存时返回 None。
+        """
+        source_mtime = os.path.getmtime(self.dict_path)
+        for cache_path in self._cache_paths():
+            if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < source_mtime:
+                continue
+            try:
+                if cache_path.endswith('.parquet'):
+                    return pd.read_parquet(cache_path, columns=['tag', 'right_tag_cn'])
+                # keep_default_na=False: 避免 'nan'、'null' 之类的标签被读成缺失值
+                return pd.read_csv(cache_path, usecols=['tag', 'right_tag_cn'], dtype=str, keep_default_na=False)
+            except Exception as e:
+                # 缓存损坏或缺少 Parquet 引擎：尝试下一个，最终重新读取 Excel
+                print(f"读取词典缓存 {cache_path} 失败: {e}")
+        return None
+
+    def _write_cache(self, df: pd.DataFrame):
+        """
+        (新) 将清洗后的词典写入缓存，下次启动直接读取。
+        先写临时文件再替换，避免中途退出留下不完整的缓存。写入失败不影响本次加载。
+        """
+        df = df[['tag', 'right_tag_cn']].reset_index(drop=True)
+        for cache_path in self._cache_paths():
+            tmp_path = cache_path + ".tmp"
+            try:
+                if cache_path.endswith('.parquet'):
+                    df.to_parquet(tmp_path, index=False)
+                else:
+                    df.to_csv(tmp_path, index=False, encoding='utf-8')
+                os.replace(tmp_path, cache_path)
+                return
+            except Exception as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if not isinstance(e, ImportError):
+                    print(f"写入词典缓存 {cache_path} 失败: {e}")
+
+    def _build_ngram_index(self):
+        """
+        (新) 为所有中文标签建立单字和二元组倒排索引，
+        模糊搜索时只需检查候选标签，而不必遍历整个词表。
+        """
+        char_index: Dict[str, List[int]] = {}
+        bigram_index: Dict[str, Set[int]] = {}
+        for i, cn_tag in enumerate(self._all_cn_tags):
+            for char in set(cn_tag):
+                char_index.setdefault(char, []).append(i)
+            for j in range(len(cn_tag) - 1):
+                bigram_index.setdefault(cn_tag[j:j + 2], set()).add(i)
+        self._char_index = char_index
+        self._bigram_index = bigram_index
+
+    def _candidate_indices(self, term: str) -> List[int]:
+        """
+        (新) 返回可能包含 term 的标签下标 (升序)。
+        单字查询直接使用单字索引；更长的查询对各个二元组的倒排集合求交集 (从最小的集合开始)。
+        结果仍需调用方用子串判断做最终确认。
+        """
+        if len(term) == 1:
+            return self._char_index.get(term, [])
+
+        postings = []
+        for j in range(len(term) - 1):
+            posting = self._bigram_index.get(term[j:j + 2])
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return []
+        return sorted(candidates)
+
     def fuzzy_lookup_suggestions(self, partial_cn_term: str, allowed_en_tags: Optional[Set[str]] = None) -> List[str]:
         """
         根据部分中文输入，模糊搜索所有包含该词的完整中文标签 (联想词)。
@@ -87,26 +182,24 @@ class DictionaryManager:
         if not partial_cn_term:
             return []
             
-        # 1. 执行原始模糊匹配
-        raw_suggestions = []
-        for cn_tag in self._all_cn_tags:
-            if partial_cn_term in cn_tag:
-                raw_suggestions.append(cn_tag)
-                
+        # 1. (新) 通过倒排索引找出候选标签，再用子串判断确认 (保持词典中的原始顺序)
         # 2. 如果提供了 allowed_en_tags，则进行过滤 (Feature 1)
-        if allowed_en_tags is None:
-            # 未提供过滤集，返回原始结果 (限制数量)
-            return raw_suggestions[:200]
-        
-        filtered_suggestions = []
-        for cn_tag in raw_suggestions:
-            en_tag = self._cn_to_en_tag.get(cn_tag)
-            # 检查这个中文标签对应的英文标签是否在允许的集合中
-            if en_tag and en_tag in allowed_en_tags:
-                filtered_suggestions.append(cn_tag)
-                
-        # 限制返回的数量以防止列表过长
-        return filtered_suggestions[:200]
+        # 限制返回的数量以防止列表过长：找到 200 个结果后提前结束
+        suggestions = []
+        for i in self._candidate_indices(partial_cn_term):
+            cn_tag = self._all_cn_tags[i]
+            if partial_cn_term not in cn_tag:
+                continue
+            if allowed_en_tags is not None:
+                en_tag = self._cn_to_en_tag.get(cn_tag)
+                # 检查这个中文标签对应的英文标签是否在允许的集合中
+                if not (en_tag and en_tag in allowed_en_tags):
+                    continue
+            suggestions.append(cn_tag)
+            if len(suggestions) >= 200:
+                break
+
+        return suggestions
 
     def get_search_tags_from_cn_list(self, cn_terms: List[str]) -> List[str]:
         """
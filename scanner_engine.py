@@ -1,6 +1,8 @@
 import os
+import queue
 import threading
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Set, Tuple
 import time
 
 # 导入依赖模块
@@ -10,17 +12,31 @@ from database_manager import DatabaseManager # 需要 DatabaseManager 实例
 class ScanEngine:
     """
     负责管理文件系统扫描、调用标签处理和数据库存储的引擎。
-    使用线程锁确保多线程访问状态时的安全。
+    (新) 扫描状态以不可变快照的形式发布：写入方构造新的字典后整体替换引用，
+    读取方直接取引用，无需加锁。线程锁只用于扫描的启动 / 结束判定。
     """
     
     # 支持的图片文件扩展名
     SUPPORTED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+    # (新) 集合形式，按文件名末尾 4 / 5 个字符查找 (扩展名只有这两种长度)
+    SUPPORTED_EXTENSION_SET = frozenset(SUPPORTED_EXTENSIONS)
+
+    # (新) 并行扫描参数
+    MAX_WALK_WORKERS = 4    # 同时遍历的文件夹数上限
+    DECODE_WORKERS = 2      # 图片读取 + 预处理线程数
+    DECODE_QUEUE_SIZE = 16  # 已预处理、等待推理的图片数上限 (每张 512x512x3 float32 约 3 MB)
+    BULK_SAVE_SIZE = 200    # (新) 每攒够这么多张图片的结果，在一个事务中写入数据库
+    PREDICT_BATCH_SIZE = 8  # (新) 每次模型调用处理的图片数
+    RESULT_QUEUE_SIZE = 16  # (新) 已打标、等待写入数据库的图片数上限
 
     def __init__(self, processor: TagProcessor, db_manager: DatabaseManager):
         self.processor = processor
         self.db_manager = db_manager
         self.lock = threading.Lock()
-        self.status = {
+        # (新) 取消标志：request_cancel() 设置，scan_folders 在处理每个文件前检查
+        self.cancel_event = threading.Event()
+        # (新) 当前状态快照：发布后不再修改，属性的重新绑定在 GIL 下是原子的
+        self._status_ref: Dict = {
             "is_scanning": False,
             "total_files": 0,
             "files_processed": 0,
@@ -29,9 +45,25 @@ class ScanEngine:
         }
 
     def get_status(self) -> Dict:
-        """返回当前的扫描状态。"""
-        with self.lock:
-            return self.status.copy()
+        """返回当前的扫描状态。(新) 无锁读取最新快照；调用方不应修改返回的字典。"""
+        return self._status_ref
+
+    def _publish_status(self, **changes):
+        """
+        (新) 在当前快照的基础上应用修改，发布一个新的快照。
+        同一时刻只有一个线程写入状态 (扫描线程，或扫描期间的数据库写入线程)，读-改-写无需加锁。
+        """
+        status = dict(self._status_ref)
+        status.update(changes)
+        self._status_ref = status
+
+    def request_cancel(self):
+        """(新) 请求停止正在进行的扫描。已处理的文件会保留在数据库中。"""
+        self.cancel_event.set()
+
+    def reset_cancel(self):
+        """(新) 清除之前的取消请求。自行管理扫描任务的调用方在接受新任务时调用 (见 scan_folders 的 reset_cancel 参数)。"""
+        self.cancel_event.clear()
             
     def start_scan(self, folder_path: str, progress_callback=None, force_rescan: bool = False):
         """
@@ -43,25 +75,212 @@ class ScanEngine:
             progress_callback: 进度更新回调函数（在此应用中未使用）。
             force_rescan: 如果为 True，则不跳过任何文件，强制重新打标和存储。
         """
+        self.scan_folders([folder_path], progress_callback, force_rescan)
+
+    @classmethod
+    def _iter_image_paths(cls, folder_path: str):
+        """
+        (新) 递归遍历文件夹，逐个产出支持的图片路径。
+        os.scandir 的 DirEntry 自带目录项的类型信息，判断子目录时无需额外的 stat 调用，
+        entry.path 也已经拼接好。与 os.walk 一样：不进入符号链接指向的目录，无法读取的目录直接跳过。
+        """
+        try:
+            with os.scandir(folder_path) as it:
+                entries = list(it)
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from cls._iter_image_paths(entry.path)
+                continue
+            name = entry.name
+            if name[-4:].lower() in cls.SUPPORTED_EXTENSION_SET or name[-5:].lower() in cls.SUPPORTED_EXTENSION_SET:
+                # 指向目录的符号链接不是图片 (os.walk 同样把它归为目录)
+                if not entry.is_dir():
+                    yield entry.path
+
+    @staticmethod
+    def _drop_nested_folders(folder_paths: List[str]) -> List[str]:
+        """
+        (新) 去掉重复的文件夹以及位于其他文件夹之内的子文件夹 (保持原有顺序)。
+        遍历是递归的，嵌套的受管文件夹 (例如 D:/Pics 与 D:/Pics/Anime) 中的文件已被外层文件夹覆盖。
+        """
+        keys = [os.path.normcase(os.path.abspath(folder_path)) for folder_path in folder_paths]
+        kept: List[str] = []
+        for i, (folder_path, key) in enumerate(zip(folder_paths, keys)):
+            covered = False
+            for j, other in enumerate(keys):
+                if j == i:
+                    continue
+                if (other == key and j < i) or key.startswith(other.rstrip(os.sep) + os.sep):
+                    covered = True
+                    break
+            if covered:
+                print(f"跳过 '{folder_path}'：已包含在其他扫描文件夹中。")
+            else:
+                kept.append(folder_path)
+        return kept
+
+    def _collect_files(self, folder_path: str, already_indexed_paths: Set[str], force_rescan: bool) -> Tuple[List[str], int]:
+        """
+        (新) 遍历一个文件夹，返回 (需要扫描的新文件列表, 文件夹中支持的图片总数)。
+        可在多个线程中并行调用 (只读取 already_indexed_paths)。
+        """
+        files_to_scan: List[str] = []
+        indexed_count = 0 # (新) 只计数被跳过的已索引文件，不保存它们的路径
+        
+        # (新) 根目录只规范化一次；文件名不含路径分隔符，DirEntry 拼接出的路径仍是规范化的
+        for normalized_path in self._iter_image_paths(os.path.normpath(folder_path)):
+            # 只有在非强制重扫模式下才跳过
+            if not force_rescan and normalized_path in already_indexed_paths:
+                indexed_count += 1
+                continue # 跳过已索引文件
+            
+            files_to_scan.append(normalized_path)
+        
+        return files_to_scan, indexed_count + len(files_to_scan)
+
+    def _decode_worker(self, path_queue: queue.Queue, decoded_queue: queue.Queue):
+        """
+        (新) 解码线程：从 path_queue 取出 (文件夹, 路径)，预处理图片后放入 decoded_queue。
+        每个路径都恰好产生一个结果 (预处理失败时为 None)，消费者据此计数。
+        """
+        while True:
+            try:
+                folder_path, file_path = path_queue.get_nowait()
+            except queue.Empty:
+                return
+            processed_image = None
+            if os.path.exists(file_path):
+                processed_image = self.processor._preprocess_image_tf(file_path)
+            decoded_queue.put((folder_path, file_path, processed_image))
+
+    def _stop_decode_workers(self, path_queue: queue.Queue, decoded_queue: queue.Queue, workers: List[threading.Thread]):
+        """
+        (新) 取消扫描时调用：清空待解码的路径，并持续取走已解码的结果，
+        让阻塞在 decoded_queue.put 上的解码线程能够退出。
+        """
+        while True:
+            try:
+                path_queue.get_nowait()
+            except queue.Empty:
+                break
+        while any(worker.is_alive() for worker in workers):
+            try:
+                decoded_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _flush_saves(self, pending_saves: List[Tuple[str, List[Dict]]], new_images: bool = False):
+        """
+        (新) 将缓冲区中的打标结果批量写入数据库，然后清空缓冲区。
+        整批失败时逐张重试，避免一张图片的数据问题导致整批丢失。
+        new_images: 增量扫描时为 True (这些文件都不在已索引集合中)，数据库层走新图片的快速插入路径。
+        """
+        if not pending_saves:
+            return
+        # 路径在 _collect_files 中已经规范化，数据库层无需再次处理
+        if self.db_manager.bulk_save_tags(pending_saves, file_path_is_normalized=True, new_images=new_images):
+            print(f"  -> 成功批量保存 {len(pending_saves)} 张图片的标签。")
+        else:
+            save_one = self.db_manager.insert_new_image_with_tags if new_images else self.db_manager.save_tags_to_db
+            for file_path, tags_list in pending_saves:
+                if not save_one(file_path, tags_list, file_path_is_normalized=True):
+                    print(f"  -> 数据库保存失败，跳过文件: {os.path.basename(file_path)}")
+        pending_saves.clear()
+
+    def _save_worker(self, results_queue: queue.Queue, total_files: int, progress_callback=None, new_images: bool = False):
+        """
+        (新) 流水线第 3 阶段：从 results_queue 取出 (文件夹, 路径, 标签列表)，攒够一批后写入数据库，并更新扫描进度。
+        标签列表为 None 表示图片读取或预处理失败。收到 None 时写入剩余的结果并退出。
+        这是唯一写入数据库的线程，无需额外的数据库锁。
+        """
+        pending_saves: List[Tuple[str, List[Dict]]] = []
+        while True:
+            item = results_queue.get()
+            if item is None:
+                break
+            folder_path, file_path, tags_list = item
+            file_name = os.path.basename(file_path)
+
+            try:
+                if tags_list is None:
+                    print(f"  -> {file_name}: 图片读取或预处理失败，跳过文件。")
+                elif tags_list:
+                    # 加入缓冲区，攒够一批后在一个事务中存储到数据库 (DBManager 负责处理冲突和更新)
+                    pending_saves.append((file_path, tags_list))
+                    print(f"  -> {file_name}: 打到 {len(tags_list)} 个标签，等待保存。")
+                else:
+                    print(f"  -> {file_name}: 未打到标签，跳过文件。")
+
+                if len(pending_saves) >= self.BULK_SAVE_SIZE:
+                    self._flush_saves(pending_saves, new_images)
+            except Exception as e:
+                # 必须继续消费队列，否则推理线程会阻塞在 put 上
+                print(f"保存文件 {file_name} 失败: {e}")
+                pending_saves.clear()
+
+            # 更新进度
+            processed = self._status_ref["files_processed"] + 1
+            self._publish_status(
+                folder=folder_path,
+                files_processed=processed,
+                progress_percent=int((processed / total_files) * 100) if total_files > 0 else 100
+            )
+                    
+            # 如果提供了回调函数，则调用它
+            if progress_callback:
+                progress_callback(self.get_status())
+
+        try:
+            self._flush_saves(pending_saves, new_images)
+        except Exception as e:
+            print(f"保存剩余的打标结果失败: {e}")
+
+    def scan_folders(self, folder_paths: List[str], progress_callback=None, force_rescan: bool = False, reset_cancel: bool = True):
+        """
+        (新) 扫描多个文件夹。
+        - 多个文件夹的目录遍历在线程池中并行进行；
+        - 流水线第 1 阶段：若干解码线程负责读取并预处理图片，放入有界队列；
+        - 流水线第 2 阶段：当前线程按批次进行模型推理，把结果放入另一个有界队列；
+        - 流水线第 3 阶段：数据库写入线程批量保存结果并更新进度。
+        reset_cancel: 为 False 时不清除启动前收到的取消请求 (由调用方在接受任务时调用 reset_cancel())，
+        这样在任务排队到真正开始之间发出的取消不会丢失。
+        """
         with self.lock:
-            if self.status["is_scanning"]:
+            if self._status_ref["is_scanning"]:
                 print("扫描正在进行中，跳过新的启动请求。")
                 return
 
-            self.status["is_scanning"] = True
-            self.status["total_files"] = 0
-            self.status["files_processed"] = 0
-            self.status["progress_percent"] = 0
-            self.status["folder"] = folder_path
+            self._publish_status(
+                is_scanning=True,
+                total_files=0,
+                files_processed=0,
+                progress_percent=0,
+                folder=folder_paths[0] if folder_paths else ""
+            )
+            # 之前的取消请求只作用于当时正在进行的扫描
+            if reset_cancel:
+                self.cancel_event.clear()
 
-        print(f"扫描引擎启动: {folder_path} (强制重新扫描: {force_rescan})")
+        print(f"扫描引擎启动: {folder_paths} (强制重新扫描: {force_rescan})")
 
-        if not os.path.isdir(folder_path):
+        valid_folders = []
+        for folder_path in folder_paths:
+            if os.path.isdir(folder_path):
+                valid_folders.append(folder_path)
+            else:
+                print(f"错误: 路径 '{folder_path}' 无效或不存在。")
+        valid_folders = self._drop_nested_folders(valid_folders)
+
+        if not valid_folders:
             with self.lock:
-                self.status["is_scanning"] = False
-            print(f"错误: 路径 '{folder_path}' 无效或不存在。")
+                self._publish_status(is_scanning=False)
             return
 
+        results_queue: queue.Queue = queue.Queue(maxsize=self.RESULT_QUEUE_SIZE)
+        save_worker: Optional[threading.Thread] = None
+
         try:
             # 1. 获取已扫描文件列表 (或为空集)
             if force_rescan:
@@ -72,104 +291,111 @@ class ScanEngine:
                 already_indexed_paths = self.db_manager.get_all_indexed_file_paths()
                 print(f"找到 {len(already_indexed_paths)} 个已索引文件。")
             
-            files_to_scan: List[str] = []
-            all_files_in_folder: List[str] = [] # 用于计算总数
-            
-            # 2. 第一次遍历：筛选出需要扫描的新文件
-            for root, _, files in os.walk(folder_path):
-                for file in files:
-                    if file.lower().endswith(self.SUPPORTED_EXTENSIONS):
-                        full_path = os.path.join(root, file)
-                        normalized_path = os.path.normpath(full_path) 
-                        all_files_in_folder.append(normalized_path)
-                        
-                        # 只有在非强制重扫模式下才跳过
-                        if not force_rescan and normalized_path in already_indexed_paths:
-                            continue # 跳过已索引文件
-                        
-                        files_to_scan.append(normalized_path)
+            # 2. 第一次遍历：并行遍历各个文件夹，筛选出需要扫描的新文件
+            with ThreadPoolExecutor(max_workers=min(self.MAX_WALK_WORKERS, len(valid_folders))) as pool:
+                walk_results = list(pool.map(
+                    lambda folder: self._collect_files(folder, already_indexed_paths, force_rescan),
+                    valid_folders
+                ))
+            # (新) 打标阶段不再需要已索引路径集合，释放本地引用
+            already_indexed_paths = None
+
+            # (新) 放入队列时再按路径去重，同一个文件只解码、打标一次
+            path_queue: queue.Queue = queue.Queue()
+            seen_paths: Set[str] = set()
+            total_in_folders = 0
+            for folder_path, (folder_files, folder_total) in zip(valid_folders, walk_results):
+                total_in_folders += folder_total
+                for file_path in folder_files:
+                    path_key = os.path.normcase(file_path)
+                    if path_key in seen_paths:
+                        total_in_folders -= 1
+                        continue
+                    seen_paths.add(path_key)
+                    path_queue.put((folder_path, file_path))
+            files_to_process = path_queue.qsize()
+            walk_results = None # 路径已全部放入 path_queue，不再保留第二份列表
+            seen_paths = None
             
             # 3. 设置初始状态和总文件数
-            with self.lock:
-                # 总文件数 = 文件夹中所有文件
-                self.status["total_files"] = len(all_files_in_folder)
-                
-                if force_rescan:
-                    # 强制重扫模式下，从 0 开始处理
-                    self.status["files_processed"] = 0
-                    files_to_process = len(all_files_in_folder)
-                    print(f"强制重新扫描：总共 {files_to_process} 个文件需要处理。")
-                else:
-                    # 增量扫描模式下，从已索引的文件数开始
-                    self.status["files_processed"] = len(already_indexed_paths)
-                    files_to_process = len(files_to_scan) # 仅遍历这些文件
-                    print(f"增量扫描：已索引 {len(already_indexed_paths)} 个文件，新增 {files_to_process} 个文件需要处理。")
-                
-                # 更新进度百分比
-                if self.status["total_files"] > 0:
-                     self.status["progress_percent"] = int((self.status["files_processed"] / self.status["total_files"]) * 100)
-                else:
-                     self.status["progress_percent"] = 0
-                     
-            total_files = self.status["total_files"] # 获取最新的总数
+            # 总文件数 = 所有文件夹中的所有文件
+            total_files = total_in_folders
             
-            # 4. 实际扫描未索引的新文件 (或所有文件，如果是强制重扫)
-            for i, file_path in enumerate(files_to_scan):
-                
-                # a. 调用标签处理
-                print(f"[{i+1}/{files_to_process}] 正在打标: {os.path.basename(file_path)}")
-                
-                # 尝试打标，如果失败则跳过
+            # 已索引 (被跳过) 的文件直接计为已处理；强制重扫模式下从 0 开始
+            already_processed = total_in_folders - files_to_process
+            if force_rescan:
+                print(f"强制重新扫描：总共 {files_to_process} 个文件需要处理。")
+            else:
+                print(f"增量扫描：已索引 {already_processed} 个文件，新增 {files_to_process} 个文件需要处理。")
+            
+            # 更新进度百分比
+            self._publish_status(
+                total_files=total_files,
+                files_processed=already_processed,
+                progress_percent=int((already_processed / total_files) * 100) if total_files > 0 else 0
+            )
+
+            # 4. 启动解码线程 (第 1 阶段) 和数据库写入线程 (第 3 阶段)
+            decoded_queue: queue.Queue = queue.Queue(maxsize=self.DECODE_QUEUE_SIZE)
+            decode_workers: List[threading.Thread] = []
+            for _ in range(min(self.DECODE_WORKERS, files_to_process)):
+                worker = threading.Thread(target=self._decode_worker, args=(path_queue, decoded_queue), daemon=True)
+                worker.start()
+                decode_workers.append(worker)
+
+            # 增量扫描时待处理的文件都不在已索引集合中，可以走新图片的快速插入路径
+            save_worker = threading.Thread(
+                target=self._save_worker, args=(results_queue, total_files, progress_callback, not force_rescan), daemon=True
+            )
+            save_worker.start()
+            
+            # 5. 实际扫描未索引的新文件 (或所有文件，如果是强制重扫)
+            #    (新) 第 2 阶段：每次从解码队列取出一批图片，一次模型调用完成整批打标
+            i = 0
+            while i < files_to_process:
+                if self.cancel_event.is_set():
+                    print(f"扫描已取消，剩余 {files_to_process - i} 个文件未处理。")
+                    self._stop_decode_workers(path_queue, decoded_queue, decode_workers)
+                    break
+
+                batch = [decoded_queue.get() for _ in range(min(self.PREDICT_BATCH_SIZE, files_to_process - i))]
+                batch_paths = [file_path for _, file_path, _ in batch]
+
                 try:
-                    # --- 修复开始 ---
-                    # 错误: process_image 返回 (image_path, tags_list) 元组
-                    # tags = self.processor.process_image(file_path)
-                    
-                    # 修正: 正确解包元组，我们只关心标签列表
-                    _ , tags_list = self.processor.process_image(file_path)
-                    
-                    # b. 存储到数据库 (DBManager 负责处理冲突和更新)
-                    # 修正: 使用 tags_list 变量
-                    if tags_list and self.db_manager.save_tags_to_db(file_path, tags_list):
-                        print(f"  -> 成功保存 {len(tags_list)} 个标签。")
-                    else:
-                        print(f"  -> 数据库保存失败或未打到标签，跳过文件。")
-                    # --- 修复结束 ---
-                        
+                    batch_results = self.processor.process_images(
+                        batch_paths, self.PREDICT_BATCH_SIZE, [processed_image for _, _, processed_image in batch]
+                    )
                 except Exception as e:
-                    print(f"打标或保存文件 {os.path.basename(file_path)} 失败: {e}")
-                    
-                
-                # c. 更新进度
-                with self.lock:
-                    self.status["files_processed"] += 1
-                    processed = self.status["files_processed"]
-                    
-                    if total_files > 0:
-                        self.status["progress_percent"] = int((processed / total_files) * 100)
-                    else:
-                        self.status["progress_percent"] = 100 
-                        
-                # 如果提供了回调函数，则调用它
-                if progress_callback:
-                    progress_callback(self.get_status())
-                
-                # 模拟 IO 延时，避免 CPU 占用过高
-                # time.sleep(0.01) 
+                    print(f"批量打标失败 ({len(batch)} 个文件): {e}")
+                    batch_results = [(file_path, []) for file_path in batch_paths]
+
+                for (folder_path, file_path, processed_image), (_, tags_list) in zip(batch, batch_results):
+                    i += 1
+                    print(f"[{i}/{files_to_process}] 正在打标: {os.path.basename(file_path)}")
+                    results_queue.put((folder_path, file_path, None if processed_image is None else tags_list))
 
         except Exception as e:
             print(f"扫描引擎运行时发生未知错误: {e}")
         finally:
-            # 5. 扫描结束，更新最终状态
+            # 6. 通知数据库写入线程保存剩余的结果并退出 (包括扫描被取消或出错的情况)
+            if save_worker is not None:
+                results_queue.put(None)
+                save_worker.join()
+
+            # 扫描结束，更新最终状态
             with self.lock:
-                self.status["is_scanning"] = False
+                final_status = {"is_scanning": False}
+                total_files = self._status_ref["total_files"]
                 
-                # 确保在扫描结束后，如果 total > 0，进度达到 100%
-                if self.status["total_files"] > 0:
-                    self.status["files_processed"] = self.status["total_files"]
-                    self.status["progress_percent"] = 100
-                elif self.status["total_files"] == 0:
-                    self.status["files_processed"] = 0
-                    self.status["progress_percent"] = 0
-
-            print(f"扫描完成，总共处理了 {self.status['files_processed']} 个文件。")
\ No newline at end of file
+                # 确保在扫描结束后，如果 total > 0，进度达到 100% (被取消时保留实际进度)
+                if self.cancel_event.is_set():
+                    pass
+                elif total_files > 0:
+                    final_status["files_processed"] = total_files
+                    final_status["progress_percent"] = 100
+                elif total_files == 0:
+                    final_status["files_processed"] = 0
+                    final_status["progress_percent"] = 0
+                self._publish_status(**final_status)
+
+            print(f"扫描完成，总共处理了 {self._status_ref['files_processed']} 个文件。")
\ No newline at end of file
@@ -1,6 +1,8 @@
 import os
+import threading
 import numpy as np
-from typing import List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional
 from PIL import Image
 
 # 尝试导入 TensorFlow/Keras
@@ -13,10 +15,29 @@ except ImportError:
 
 # --- 配置常量 ---
 MODEL_PATH = "model-resnet_custom_v3.h5"
+# (新) FP16 量化的 TFLite 模型 (首次启动时由 MODEL_PATH 转换生成)；不可用时回退到 Keras 模型
+TFLITE_MODEL_PATH = "model-resnet_custom_v3_fp16.tflite"
+USE_TFLITE = True
 TAGS_FILE = "tags.txt"
 SCORE_THRESHOLD = 0.5
 # 修正模型输入尺寸以匹配错误信息中的要求 (512x512)
 IMAGE_SIZE = (512, 512)
+# (新) 批量推理时每批的图片数
+PREDICT_BATCH_SIZE = 8
+# (新) 批量打标时使用 TensorFlow 完成图片解码和缩放 (单张图片仍使用 PIL)
+USE_TF_PREPROCESS = True
+
+
+@tf.function(input_signature=[tf.TensorSpec(shape=[], dtype=tf.string)])
+def _tf_load_image(path):
+    """
+    (新) 在 TensorFlow 图中完成读取、解码、缩放和归一化，结果与 _preprocess_image 基本一致：
+    取第一帧的 RGB 三通道，双三次插值缩放，并像 PIL 一样量化到整数像素值后再归一化。
+    """
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image = tf.image.resize(image, (IMAGE_SIZE[1], IMAGE_SIZE[0]), method='bicubic', antialias=True)
+    image = tf.round(tf.clip_by_value(image, 0.0, 255.0))
+    return image / 255.0
 
 
 class TagProcessor:
@@ -29,18 +50,101 @@ class TagProcessor:
         初始化标签处理器，加载模型和标签列表。
         """
         self.threshold = threshold
-        self.tags = self._load_tags()
-        self.model = self._load_model()
+        # (新) 以 object 数组保存标签，便于用筛选出的下标直接取出标签名
+        self.tags = np.array(self._load_tags(), dtype=object)
+
+        # (新) 优先使用 TFLite 解释器；只有在它不可用时才加载 Keras 模型
+        self._interpreter_lock = threading.Lock() # TFLite 解释器不是线程安全的
+        self.interpreter = self._load_interpreter() if USE_TFLITE else None
+        self.model = self._load_model() if self.interpreter is None else None
+        # (新) Keras 模型的具体函数 (固定输入签名，只追踪一次)，避免 model.predict 每次调用的 Python 调度开销
+        self._model_fn = self._build_model_fn(self.model) if self.model is not None else None
         
         # 检查关键组件是否加载成功
-        if not self.model or not self.tags:
+        if not self._has_model() or len(self.tags) == 0:
              raise RuntimeError("TagProcessor 初始化失败：模型或标签列表加载失败。")
 
         # 最终验证模型和标签数量是否匹配
-        if self.model.output_shape[1] != len(self.tags):
-            print(f"警告: 模型输出维度 ({self.model.output_shape[1]}) 与标签数量 ({len(self.tags)}) 不匹配！请检查 {TAGS_FILE}。")
+        output_size = self._output_size()
+        if output_size != len(self.tags):
+            print(f"警告: 模型输出维度 ({output_size}) 与标签数量 ({len(self.tags)}) 不匹配！请检查 {TAGS_FILE}。")
             
-        print(f"标签处理器初始化完成，模型已加载，分数筛选阈值: {self.threshold}")
+        backend = "TFLite (FP16)" if self.interpreter is not None else "Keras"
+        print(f"标签处理器初始化完成，模型已加载 ({backend})，分数筛选阈值: {self.threshold}")
+
+    def _has_model(self) -> bool:
+        """(新) 是否有可用的推理后端。"""
+        return self.interpreter is not None or self.model is not None
+
+    def _output_size(self) -> int:
+        """(新) 模型输出的标签数量。"""
+        if self.interpreter is not None:
+            return int(self.interpreter.get_output_details()[0]['shape'][-1])
+        return self.model.output_shape[1]
+
+    def _load_interpreter(self):
+        """
+        (新) 加载 FP16 量化的 TFLite 模型。文件不存在时从 Keras 模型转换一次并保存。
+        失败时返回 None 并打印警告，调用方回退到 Keras 模型。
+        """
+        try:
+            if not os.path.exists(TFLITE_MODEL_PATH):
+                keras_model = self._load_model()
+                if keras_model is None:
+                    return None
+                print(f"正在将 {MODEL_PATH} 转换为 FP16 TFLite 模型 (只需进行一次)...")
+                converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                converter.target_spec.supported_types = [tf.float16]
+                tflite_model = converter.convert()
+                # 先写入临时文件再重命名，避免中断时留下不完整的模型文件
+                tmp_path = TFLITE_MODEL_PATH + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(tflite_model)
+                os.replace(tmp_path, TFLITE_MODEL_PATH)
+
+            interpreter = tf.lite.Interpreter(model_path=TFLITE_MODEL_PATH, num_threads=os.cpu_count())
+            interpreter.allocate_tensors()
+            print(f"成功加载 TFLite 模型: {TFLITE_MODEL_PATH}")
+            return interpreter
+        except Exception as e:
+            print(f"警告: 无法加载 TFLite 模型，将使用 Keras 模型。错误详情: {e}")
+            return None
+
+    @staticmethod
+    def _build_model_fn(model):
+        """
+        (新) 为 Keras 模型生成输入签名固定为 (任意批次, 512, 512, 3) float32 的具体函数。
+        失败时返回 None，调用方继续使用 model.predict。
+        """
+        try:
+            fn = tf.function(
+                lambda x: model(x, training=False),
+                input_signature=[tf.TensorSpec(shape=(None, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=tf.float32)]
+            )
+            return fn.get_concrete_function()
+        except Exception as e:
+            print(f"警告: 无法为模型生成具体函数，将使用 model.predict。错误详情: {e}")
+            return None
+
+    def _predict(self, batch: np.ndarray) -> np.ndarray:
+        """(新) 对 (N, 512, 512, 3) 的输入执行推理，返回 (N, 标签数) 的分数。"""
+        if self.interpreter is None:
+            if self._model_fn is not None:
+                return self._model_fn(tf.constant(batch, dtype=tf.float32)).numpy()
+            # verbose=0 避免打印进度条
+            return self.model.predict(batch, verbose=0)
+
+        with self._interpreter_lock:
+            input_details = self.interpreter.get_input_details()[0]
+            # 批次大小变化时调整输入张量形状
+            if tuple(input_details['shape']) != batch.shape:
+                self.interpreter.resize_tensor_input(input_details['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+            self.interpreter.set_tensor(input_details['index'], np.ascontiguousarray(batch, dtype=np.float32))
+            self.interpreter.invoke()
+            # get_tensor 返回的数组在下一次 invoke 时会被覆盖，因此复制一份
+            return self.interpreter.get_tensor(self.interpreter.get_output_details()[0]['index']).copy()
 
     def _load_model(self):
         """加载 Keras 模型。如果失败，则返回 None 并打印错误。"""
@@ -85,59 +189,123 @@ class TagProcessor:
             print(f"图片预处理失败: {image_path}。错误: {e}")
             return None
 
-    def _perform_danbooru_prediction(self, image_path: str) -> List[Tuple[str, float]]:
+    def _preprocess_image_tf(self, image_path: str) -> np.ndarray | None:
+        """
+        (新) 批量打标使用的预处理 (可在多个线程中并行调用，TensorFlow 运算会释放 GIL)。
+        TensorFlow 无法解码的图片回退到 PIL 路径。
+        """
+        if not USE_TF_PREPROCESS:
+            return self._preprocess_image(image_path)
+        try:
+            return _tf_load_image(tf.constant(image_path)).numpy()[np.newaxis]
+        except Exception:
+            return self._preprocess_image(image_path)
+
+    def _perform_danbooru_prediction(self, image_path: str, processed_image: np.ndarray | None = None) -> List[Tuple[str, float]]:
         """
-        执行 DeepDanbooru 模型的预测。
+        执行 DeepDanbooru 模型的预测，只返回分数不低于阈值的 (标签, 分数)。
+        (新) 如果调用方已经预处理过图片 (例如在解码线程中)，可直接传入 processed_image。
         """
-        if not self.model: # 再次检查模型是否加载
+        if not self._has_model(): # 再次检查模型是否加载
             return []
             
-        processed_image = self._preprocess_image(image_path)
+        if processed_image is None:
+            processed_image = self._preprocess_image(image_path)
         
         if processed_image is None:
             return []
 
-        # 执行预测 (verbose=0 避免打印进度条)
+        # 执行预测
         try:
-            predictions = self.model.predict(processed_image, verbose=0)[0]
+            predictions = self._predict(processed_image)[0]
         except Exception as e:
             print(f"模型预测失败: {image_path}。错误: {e}")
             return []
         
+        return self._select_tags(predictions)
+
+    def _select_tags(self, predictions: np.ndarray) -> List[Tuple[str, float]]:
+        """(新) 从单张图片的模型输出中筛选出分数不低于阈值的 (标签, 分数)。"""
         # 验证模型输出维度
         if len(predictions) != len(self.tags):
             # 这个检查在 __init__ 中已经有了警告，这里仅作保护性检查
             return []
             
-        results = []
-        for tag_name, score in zip(self.tags, predictions):
-            results.append((tag_name, float(score)))
+        # (新) 用 NumPy 一次性完成阈值筛选，只有通过的几十个标签会进入 Python 循环
+        # (阈值以 float64 比较，与逐个 float(score) >= threshold 的结果一致)
+        kept = np.nonzero(predictions >= np.float64(self.threshold))[0]
+        return list(zip(self.tags[kept].tolist(), predictions[kept].tolist()))
 
-        return results
-
-    def process_image(self, image_path: str) -> Tuple[str, List[Dict]]:
+    def process_image(self, image_path: str, processed_image: np.ndarray | None = None) -> Tuple[str, List[Dict]]:
         """
         处理单张图片，进行打标和分数筛选。
+        (新) processed_image: 可选，由 _preprocess_image 预先得到的模型输入。
         """
         if not os.path.exists(image_path):
             print(f"错误: 找不到文件 {image_path}")
             return image_path, []
 
-        # 1. 执行标签预测
-        raw_predictions = self._perform_danbooru_prediction(image_path)
+        # 1. 执行标签预测 (已按阈值筛选)
+        raw_predictions = self._perform_danbooru_prediction(image_path, processed_image)
 
-        # 2. 应用分数筛选逻辑
-        filtered_tags: List[Dict] = []
-        for tag_name, score in raw_predictions:
-            if score >= self.threshold:
-                # 只保留分数高于阈值的标签
-                filtered_tags.append({
-                    "tag_name": tag_name,
-                    "score": round(score, 4)
-                })
+        # 2. 整理为结构化数据 (分数保留 4 位小数)
+        filtered_tags = self._to_tag_dicts(raw_predictions)
 
         print(f"--- 处理图片: {os.path.basename(image_path)} ---")
         print(f"筛选后标签数: {len(filtered_tags)}")
 
         # 3. 返回结构化数据 (文件路径, 标签列表)
-        return image_path, filtered_tags
\ No newline at end of file
+        return image_path, filtered_tags
+
+    @staticmethod
+    def _to_tag_dicts(raw_predictions: List[Tuple[str, float]]) -> List[Dict]:
+        """(新) 将 (标签, 分数) 列表整理为入库使用的结构 (分数保留 4 位小数)。"""
+        return [{"tag_name": tag_name, "score": round(score, 4)} for tag_name, score in raw_predictions]
+
+    def process_images(
+        self,
+        image_paths: List[str],
+        batch_size: int = PREDICT_BATCH_SIZE,
+        processed_images: Optional[List[np.ndarray | None]] = None
+    ) -> List[Tuple[str, List[Dict]]]:
+        """
+        (新) 批量处理多张图片：每 batch_size 张拼成一个 (N, 512, 512, 3) 输入，只调用一次模型。
+        processed_images: 可选，与 image_paths 一一对应的预处理结果 (例如由解码线程得到)；
+                          未提供时在线程池中并行预处理。
+        返回与 image_paths 顺序一致的 (文件路径, 标签列表)；读取或预测失败的图片标签列表为空。
+        """
+        results: List[Tuple[str, List[Dict]]] = [(path, []) for path in image_paths]
+        if not self._has_model() or not image_paths:
+            return results
+
+        # 预先分配一个批次的输入缓冲区，各批次复用
+        buf = np.empty((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+
+        with ThreadPoolExecutor(max_workers=batch_size) as pool:
+            for start in range(0, len(image_paths), batch_size):
+                chunk = range(start, min(start + batch_size, len(image_paths)))
+                if processed_images is not None:
+                    images = [processed_images[i] for i in chunk]
+                else:
+                    # 图片读取和缩放主要是 I/O 与 C 代码，可以并行进行
+                    images = list(pool.map(self._preprocess_image_tf, (image_paths[i] for i in chunk)))
+
+                # 把成功预处理的图片依次填入缓冲区
+                valid_indices = []
+                for i, image in zip(chunk, images):
+                    if image is not None:
+                        buf[len(valid_indices)] = image[0]
+                        valid_indices.append(i)
+                if not valid_indices:
+                    continue
+
+                try:
+                    predictions = self._predict(buf[:len(valid_indices)])
+                except Exception as e:
+                    print(f"批量模型预测失败 ({len(valid_indices)} 张图片)。错误: {e}")
+                    continue
+
+                for row, i in enumerate(valid_indices):
+                    results[i] = (image_paths[i], self._to_tag_dicts(self._select_tags(predictions[row])))
+
+        return results
\ No newline at end of file